@@ -1,11 +1,36 @@
 # Importing Required Libraries
+import atexit
+import bisect
+import cProfile
+import csv
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import math
 import os
-from datetime import datetime, timedelta
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date as date_type, datetime, timedelta
 from functools import wraps
 from io import BytesIO
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, make_response, send_from_directory, abort, g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
@@ -17,6 +42,19 @@ try:
 except ImportError:
     print("Warning: reportlab not installed. PDF features will not work.")
 
+# Image thumbnails
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("Warning: Pillow not installed. Profile picture thumbnails will not be generated.")
+
+# Brotli compression (optional, falls back to gzip)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # # ==================== FLASK APP SETUP ====================
 
 # app = Flask(__name__)
@@ -52,17 +90,119 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Upload folder setup
 UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')
 PATIENT_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'patients')
-os.makedirs(PATIENT_UPLOAD_FOLDER, exist_ok=True)
+PATIENT_THUMB_FOLDER = os.path.join(PATIENT_UPLOAD_FOLDER, 'thumbs')
+os.makedirs(PATIENT_THUMB_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+app.config['UPLOAD_CHUNK_SIZE'] = 64 * 1024
+app.config['ALLOWED_IMAGE_EXTENSIONS'] = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+app.config['THUMBNAIL_SIZES'] = (64, 150)
+app.config['THUMBNAIL_WORKERS'] = 2
+app.config['MEDIA_MAX_AGE'] = 365 * 24 * 3600  # content-addressed, safe to cache for a year
+app.config['UPLOAD_GC_GRACE_SECONDS'] = 3600
+
+# Hot/cold archival
+app.config['ARCHIVE_HORIZON_DAYS'] = 365
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+app.config['HISTORY_PAGE_SIZE'] = 20
+
+# Streaming export
+app.config['EXPORT_CHUNK_SIZE'] = 500
+
+# Background jobs: `python app.py` runs them in the dev server; under any other server either run
+# `flask run-jobs` as a separate process or set CLINIC_RUN_JOBS=1 so each serving process starts them
+app.config['BACKGROUND_JOBS_IN_PROCESS'] = os.environ.get('CLINIC_RUN_JOBS') == '1'
+app.config['PRESCRIPTION_EXPIRY_INTERVAL'] = 3600  # seconds
+app.config['PRESCRIPTION_BATCH_SIZE'] = 500
+app.config['SCHEDULER_TICK_SECONDS'] = 60
+app.config['SCHEDULER_LOOKAHEAD_DAYS'] = 2
+app.config['SCHEDULER_BATCH_SIZE'] = 500
+app.config['SCHEDULER_RELOAD_SECONDS'] = 300  # picks up bookings made by other processes
+app.config['REMINDER_LEAD_MINUTES'] = 24 * 60
+app.config['NO_SHOW_GRACE_MINUTES'] = 120
+app.config['REMINDER_SINK_PATH'] = None  # NDJSON file for reminders and waitlist offers; None logs them instead
+app.config['WAITLIST_HOLD_MINUTES'] = 30
+app.config['WAITLIST_SWEEP_SECONDS'] = 60
+
+# Audit log
+app.config['AUDIT_QUEUE_SIZE'] = 10000
+app.config['AUDIT_BATCH_SIZE'] = 500
+app.config['AUDIT_FLUSH_SECONDS'] = 1.0
+app.config['AUDIT_OVERFLOW_POLICY'] = 'drop'  # 'drop' or 'block' (wait AUDIT_BLOCK_SECONDS, then drop)
+app.config['AUDIT_BLOCK_SECONDS'] = 0.05
+app.config['AUDIT_LOG_PATH'] = None  # append-only NDJSON file instead of the audit_event table
+app.config['AUDIT_LOG_MAX_BYTES'] = 50 * 1024 * 1024
+
+# Admission control: per-client token buckets plus per-endpoint-class concurrency limits
+app.config['RATE_LIMIT_ENABLED'] = True
+app.config['RATE_LIMIT_PER_SECOND'] = 5.0  # tokens refilled per client per second
+app.config['RATE_LIMIT_BURST'] = 30
+app.config['RATE_LIMIT_COSTS'] = {'json': 1, 'page': 1, 'write': 2, 'pdf': 5}
+app.config['CONCURRENCY_LIMITS'] = {'json': 32, 'page': 16, 'write': 8, 'pdf': 2}  # None = unlimited
+app.config['ADMISSION_WAIT_SECONDS'] = 0.1  # wait this long for a slot before shedding with 503
+app.config['ADMISSION_RETRY_AFTER'] = 1
 
 # 🔹 IMPORTANT: Point directly to the edited DB file
 db_path = os.path.join(basedir, 'clinic.db')  # changed from instance_path
+db_path = os.environ.get('CLINIC_DB_PATH') or db_path  # e.g. a scratch database for the tests
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# Per-hospital appointment shards (opt-in; run 'flask split-shards' after enabling)
+app.config['SHARDING_ENABLED'] = os.environ.get('CLINIC_SHARDING') == '1'
+app.config['SHARD_FOLDER'] = os.path.join(basedir, 'instance', 'shards')
+app.config['SHARD_FANOUT_WORKERS'] = 4
+
+# Response compression / conditional GET
+app.config['COMPRESS_MIN_SIZE'] = 500  # bytes
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIMETYPES'] = {'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'}
+
+def deploy_version(folders):
+    """Newest mtime of app.py and every file under folders, skipping user uploads"""
+    newest = os.path.getmtime(__file__)
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs if name != 'uploads']
+            newest = max([newest] + [os.path.getmtime(os.path.join(root, name)) for name in files])
+    return str(int(newest))
+
+# Cached pages embed templates and static URLs, so a deploy that only touches those must change ETags too
+app.config['ETAG_SALT'] = os.environ.get('CLINIC_DEPLOY_ID') or deploy_version(
+    [os.path.join(basedir, 'templates'), os.path.join(basedir, 'static')])
+
+# Instrumentation
+app.config['SLOW_QUERY_SECONDS'] = 0.1
+app.config['PROFILING_ENABLED'] = os.environ.get('CLINIC_PROFILING') == '1'  # opt-in, then send "X-Profile: 1"
+PROFILE_FOLDER = os.path.join(basedir, 'instance', 'profiles')
+
+# Appointments live in one SQLite file per hospital when sharding is enabled
+SHARDED_TABLES = {'appointment'}
+SHARD_ID_SPAN = 10 ** 12  # ids of shard n start at n * SHARD_ID_SPAN; shard 0 is clinic.db
+active_shard = ContextVar('active_shard', default=None)
+
+def targets_sharded_table(mapper, clause):
+    if mapper is not None:
+        return db.inspect(mapper).local_table.name in SHARDED_TABLES
+    if hasattr(clause, 'table'):  # INSERT / UPDATE / DELETE
+        tables = [clause.table]
+    else:
+        tables = clause.get_final_froms() if hasattr(clause, 'get_final_froms') else []
+    return any(getattr(table, 'name', None) in SHARDED_TABLES for table in tables)
+
+class ShardRoutingSession(FlaskSession):
+    """Session that sends statements on sharded tables to the active shard's engine"""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and app.config['SHARDING_ENABLED'] and targets_sharded_table(mapper, clause):
+            shard = active_shard.get()
+            if shard is None:
+                raise RuntimeError("Appointment statement issued outside shard_router.use()")
+            if shard:
+                return shard_router.engine(shard)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': ShardRoutingSession})
 
 
 # ==================== DATABASE MODELS ====================
@@ -75,7 +215,7 @@ class Patient(db.Model):
     gender = db.Column(db.String(10), nullable=False)
     cnic = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     contact = db.Column(db.String(20), nullable=False)
     
     # NEW FIELDS for patient portal
@@ -99,7 +239,7 @@ class Doctor(db.Model):
     gender = db.Column(db.String(10), nullable=False)
     cnic = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     contact = db.Column(db.String(20), nullable=False)
     specialization = db.Column(db.String(100), nullable=False)
     qualification = db.Column(db.String(100), nullable=False)
@@ -110,6 +250,7 @@ class Doctor(db.Model):
     
     # NEW FIELD
     consultation_fee = db.Column(db.Float, default=2000.0)
+    shard_id = db.Column(db.Integer)  # appointment shard, pinned on first booking when sharding is enabled
     
     # Relationships
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
@@ -124,7 +265,7 @@ class Admin(db.Model):
     gender = db.Column(db.String(10), nullable=False)
     cnic = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     contact = db.Column(db.String(20), nullable=False)
     position = db.Column(db.String(50), nullable=False)
     title = db.Column(db.String(50))
@@ -133,19 +274,32 @@ class Admin(db.Model):
 
 class Appointment(db.Model):
     __tablename__ = 'appointment'
+    __table_args__ = (
+        db.Index('ix_appointment_patient_date', 'patient_id', 'date'),
+        db.Index('ix_appointment_date_status', 'date', 'status'),
+        db.Index('ix_appointment_status_date', 'status', 'date'),  # scheduler: scheduled rows up to a date
+        db.Index('ix_appointment_doctor_date', 'doctor_id', 'date'),
+        {'sqlite_autoincrement': True},  # lets each shard start its ids at n * SHARD_ID_SPAN
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     time = db.Column(db.String(10), nullable=False)
-    status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled
+    status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled, no-show
     symptoms = db.Column(db.Text)
     priority = db.Column(db.String(20), default='normal')  # emergency, urgent, normal
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reminder_sent_at = db.Column(db.DateTime)
 
 class MedicalRecord(db.Model):
     __tablename__ = 'medical_record'
+    __table_args__ = (
+        db.Index('ix_medical_record_patient_visit', 'patient_id', 'visit_date'),
+        db.Index('ix_medical_record_bp_systolic', 'vital_bp_systolic'),
+        db.Index('ix_medical_record_heart_rate', 'vital_heart_rate'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
@@ -153,12 +307,29 @@ class MedicalRecord(db.Model):
     diagnosis = db.Column(db.Text, nullable=False)
     treatment = db.Column(db.Text)
     prescription = db.Column(db.Text)
-    vitals = db.Column(db.Text)  # JSON string
+    vitals = db.Column(db.Text)  # JSON string (typed copies below are kept in sync)
     notes = db.Column(db.Text)
     follow_up_date = db.Column(db.Date)
+    
+    # Typed vitals parsed from the JSON string so they can be filtered/aggregated in SQL
+    vital_heart_rate = db.Column(db.Integer)
+    vital_bp_systolic = db.Column(db.Integer)
+    vital_bp_diastolic = db.Column(db.Integer)
+    vital_temperature = db.Column(db.Float)
+    vital_oxygen_saturation = db.Column(db.Integer)
+    vital_weight = db.Column(db.Float)
+    
+    @validates('vitals')
+    def sync_typed_vitals(self, key, value):
+        for column, parsed in parse_record_vitals(value).items():
+            setattr(self, column, parsed)
+        return value
 
 class Vitals(db.Model):
     __tablename__ = 'vitals'
+    __table_args__ = (
+        db.Index('ix_vitals_patient_date', 'patient_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -174,6 +345,9 @@ class Vitals(db.Model):
 
 class Prescription(db.Model):
     __tablename__ = 'prescription'
+    __table_args__ = (
+        db.Index('ix_prescription_active_end_date', 'active', 'end_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
@@ -185,9 +359,147 @@ class Prescription(db.Model):
     instructions = db.Column(db.Text)
     refills = db.Column(db.Integer, default=0)
     active = db.Column(db.Boolean, default=True)
+    
+    # Expiry tracking (filled from duration on insert or by the expiry job)
+    course_days = db.Column(db.Integer)  # None = ongoing / unparseable duration
+    end_date = db.Column(db.Date)
+    refills_used = db.Column(db.Integer, default=0)
+
+# Archive tables (cold rows moved out of appointment / vitals by archive_old_rows)
+class AppointmentArchive(db.Model):
+    __tablename__ = 'appointment_archive'
+    __table_args__ = (
+        db.Index('ix_appointment_archive_patient_date', 'patient_id', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20))
+    symptoms = db.Column(db.Text)
+    priority = db.Column(db.String(20))
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    reminder_sent_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    doctor = db.relationship('Doctor', viewonly=True)
+
+class VitalsArchive(db.Model):
+    __tablename__ = 'vitals_archive'
+    __table_args__ = (
+        db.Index('ix_vitals_archive_patient_date', 'patient_id', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    heart_rate = db.Column(db.Integer)
+    blood_pressure_systolic = db.Column(db.Integer)
+    blood_pressure_diastolic = db.Column(db.Integer)
+    temperature = db.Column(db.Float)
+    oxygen_saturation = db.Column(db.Integer)
+    weight = db.Column(db.Float)
+    height = db.Column(db.Float)
+    bmi = db.Column(db.Float)
+    notes = db.Column(db.Text)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Running per-patient statistics for each vital, maintained on insert
+class VitalsStats(db.Model):
+    __tablename__ = 'vitals_stats'
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), primary_key=True)
+    vital = db.Column(db.String(30), primary_key=True)
+    origin = db.Column(db.DateTime, nullable=False)  # x = days since this reading
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    m2 = db.Column(db.Float, nullable=False, default=0.0)  # Welford sum of squared deviations
+    sum_x = db.Column(db.Float, nullable=False, default=0.0)
+    sum_y = db.Column(db.Float, nullable=False, default=0.0)
+    sum_xx = db.Column(db.Float, nullable=False, default=0.0)
+    sum_xy = db.Column(db.Float, nullable=False, default=0.0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    last_value = db.Column(db.Float)
+    last_at = db.Column(db.DateTime)
+
+# Per-day buckets used for the rolling 7/30/90-day windows
+class VitalsDailyStats(db.Model):
+    __tablename__ = 'vitals_daily_stats'
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), primary_key=True)
+    vital = db.Column(db.String(30), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+
+# Waitlist for freed slots; the composite index orders each doctor/day queue by priority, then join time
+class WaitlistEntry(db.Model):
+    __tablename__ = 'waitlist_entry'
+    __table_args__ = (
+        db.Index('ix_waitlist_queue', 'doctor_id', 'date', 'status', 'priority_rank', 'created_at'),
+        db.Index('ix_waitlist_offer_expiry', 'status', 'offer_expires_at'),
+        db.Index('ix_waitlist_patient', 'patient_id', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    priority = db.Column(db.String(20), default='normal')
+    priority_rank = db.Column(db.Integer, nullable=False, default=3)  # emergency 1, urgent 2, normal 3
+    symptoms = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='waiting')  # waiting, offered, accepted, declined, expired
+    offered_time = db.Column(db.String(10))
+    offer_expires_at = db.Column(db.DateTime)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    doctor = db.relationship('Doctor')
+
+# Append-only audit trail of who viewed or changed patient data
+class AuditEvent(db.Model):
+    __tablename__ = 'audit_event'
+    __table_args__ = (
+        db.Index('ix_audit_event_patient', 'patient_id', 'created_at'),
+        db.Index('ix_audit_event_actor', 'actor_type', 'actor_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    actor_type = db.Column(db.String(20), nullable=False)  # patient, doctor, admin, anonymous
+    actor_id = db.Column(db.Integer)
+    route = db.Column(db.String(100), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500))
+    patient_id = db.Column(db.Integer)
+    action = db.Column(db.String(20), nullable=False)  # view, change, delete
+    status_code = db.Column(db.Integer)
+    ip_address = db.Column(db.String(45))
+
+# Hospital -> shard database (instance/shards/hospital_<id>.db)
+class HospitalShard(db.Model):
+    __tablename__ = 'hospital_shard'
+    id = db.Column(db.Integer, primary_key=True)
+    hospital = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Shards holding each patient's bookings, so patient views skip the others (clinic.db is always read)
+class PatientShard(db.Model):
+    __tablename__ = 'patient_shard'
+    patient_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+# Per-patient data version used to build ETags (patient_id 0 = shared data such as doctors)
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    patient_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 # ==================== HELPER FUNCTIONS ====================
 
+RECORD_VITAL_COLUMNS = ('vital_heart_rate', 'vital_bp_systolic', 'vital_bp_diastolic',
+                        'vital_temperature', 'vital_oxygen_saturation', 'vital_weight')
+
 def clear_sessions():
     """Clear all login sessions"""
     session.pop('admin', None)
@@ -206,6 +518,22 @@ def patient_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_login_required(f):
+    """Decorator to require admin login"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'admin' not in session:
+            flash('Please login to access this page.', 'error')
+            return redirect(url_for('login_admin'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def verify_password(stored, candidate):
+    """Check a password against a werkzeug hash (bulk imports) or a legacy plaintext value"""
+    if stored and stored.startswith(('scrypt:', 'pbkdf2:')):
+        return check_password_hash(stored, candidate)
+    return stored == candidate
+
 def calculate_bmi(weight, height):
     """Calculate BMI from weight (kg) and height (cm)"""
     if weight and height and height > 0:
@@ -213,6 +541,52 @@ def calculate_bmi(weight, height):
         return round(weight / (height_m ** 2), 2)
     return None
 
+def _to_number(value, cast):
+    """Convert a JSON value to int/float, returning None when it is not a finite number"""
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return cast(number) if math.isfinite(number) else None
+
+def parse_record_vitals(raw):
+    """Parse a MedicalRecord.vitals JSON string into typed column values"""
+    parsed = dict.fromkeys(RECORD_VITAL_COLUMNS)
+    if not raw:
+        return parsed
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return parsed
+    if not isinstance(data, dict):
+        return parsed
+    data = {str(k).lower(): v for k, v in data.items()}
+    
+    systolic = data.get('bp_systolic', data.get('blood_pressure_systolic', data.get('systolic')))
+    diastolic = data.get('bp_diastolic', data.get('blood_pressure_diastolic', data.get('diastolic')))
+    blood_pressure = data.get('blood_pressure', data.get('bp'))
+    if isinstance(blood_pressure, str) and '/' in blood_pressure:
+        systolic, diastolic = blood_pressure.split('/', 1)
+    
+    parsed['vital_heart_rate'] = _to_number(data.get('heart_rate', data.get('pulse')), int)
+    parsed['vital_bp_systolic'] = _to_number(systolic, int)
+    parsed['vital_bp_diastolic'] = _to_number(diastolic, int)
+    parsed['vital_temperature'] = _to_number(data.get('temperature', data.get('temp')), float)
+    parsed['vital_oxygen_saturation'] = _to_number(data.get('oxygen_saturation', data.get('spo2')), int)
+    parsed['vital_weight'] = _to_number(data.get('weight'), float)
+    return parsed
+
+DURATION_UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+
+def parse_duration_days(duration):
+    """Convert a prescription duration such as '2 weeks' into days (None if open-ended)"""
+    match = re.search(r'(\d+)\s*(day|week|month|year)', (duration or '').lower())
+    if not match:
+        return None
+    return int(match.group(1)) * DURATION_UNIT_DAYS[match.group(2)]
+
 def check_vital_alerts(vitals):
     """Check if any vitals are in abnormal range"""
     alerts = []
@@ -241,6 +615,927 @@ def check_vital_alerts(vitals):
     
     return alerts
 
+# ==================== INSTRUMENTATION ====================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+class Counter:
+    """Prometheus-style counter with labels"""
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    """Prometheus-style histogram with fixed buckets and labels"""
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+    
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+class Gauge:
+    """Prometheus-style gauge with labels"""
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+def format_labels(key):
+    """Render a sorted label tuple as {a="1",b="2"}"""
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in key) + '}'
+
+REQUEST_LATENCY = Histogram('clinic_request_duration_seconds', 'Request latency by endpoint')
+REQUEST_COUNT = Counter('clinic_requests_total', 'Requests by endpoint and status')
+REQUEST_SQL_COUNT = Histogram('clinic_request_sql_statements', 'SQL statements per request', SQL_COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram('clinic_request_sql_seconds', 'Time spent in SQL per request')
+SLOW_QUERIES = Counter('clinic_slow_queries_total', 'Statements slower than SLOW_QUERY_SECONDS')
+PDF_RENDER_TIME = Histogram('clinic_pdf_render_seconds', 'PDF generation time by document')
+METRICS = [REQUEST_LATENCY, REQUEST_COUNT, REQUEST_SQL_COUNT, REQUEST_SQL_TIME, SLOW_QUERIES, PDF_RENDER_TIME]
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+    if elapsed >= app.config['SLOW_QUERY_SECONDS']:
+        SLOW_QUERIES.inc()
+        params = repr(parameters) if not executemany else '<executemany>'
+        app.logger.warning("Slow query (%.1f ms): %s | params=%s",
+                           elapsed * 1000, statement[:1000], params[:1000])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    if app.config['PROFILING_ENABLED'] and request.headers.get('X-Profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+    REQUEST_COUNT.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SQL_COUNT.observe(g.get('sql_count', 0), endpoint=endpoint)
+    REQUEST_SQL_TIME.observe(g.get('sql_time', 0.0), endpoint=endpoint)
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_FOLDER, exist_ok=True)
+        path = os.path.join(PROFILE_FOLDER, f"{endpoint}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+        app.logger.info("Profiled %s -> %s", request.path, path)
+    return response
+
+def timed_pdf(document):
+    """Decorator to record PDF generation time"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                PDF_RENDER_TIME.observe(time.perf_counter() - started, document=document)
+        return decorated_function
+    return decorator
+
+@app.route('/metrics')
+def metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# ==================== ADMISSION CONTROL ====================
+
+ADMISSION_REQUESTS = Counter('clinic_admission_total',
+                             'Admission decisions by endpoint class and outcome (admitted, rate_limited, shed)')
+ADMISSION_IN_FLIGHT = Gauge('clinic_admission_in_flight', 'Requests holding a concurrency slot by endpoint class')
+METRICS.extend([ADMISSION_REQUESTS, ADMISSION_IN_FLIGHT])
+ADMISSION_EXEMPT_ENDPOINTS = {'static', 'patient_media', 'patient_media_thumbnail', 'metrics'}
+
+class RateLimitBackend:
+    """Token-bucket storage; implement take() on a shared store to limit across workers"""
+    def take(self, key, cost, rate, burst, now):
+        """Consume cost tokens, returning 0 if allowed or the seconds until enough have refilled"""
+        raise NotImplementedError
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Per-process token buckets"""
+    def __init__(self, max_keys=100000):
+        self.buckets = {}  # key -> (tokens, updated)
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+    
+    def take(self, key, cost, rate, burst, now):
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return 0.0
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now, burst / rate)
+            return (cost - tokens) / rate
+    
+    def _prune(self, now, refill_seconds):
+        # A bucket idle for a full refill is back at burst, so forgetting it changes nothing
+        self.buckets = {key: value for key, value in self.buckets.items() if now - value[1] < refill_seconds}
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests for one endpoint class; callers wait briefly, never queue unbounded"""
+    def __init__(self, name, limit):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(limit)
+    
+    def acquire(self, timeout):
+        if not self.semaphore.acquire(timeout=timeout):
+            return False
+        ADMISSION_IN_FLIGHT.inc(endpoint_class=self.name)
+        return True
+    
+    def release(self):
+        ADMISSION_IN_FLIGHT.dec(endpoint_class=self.name)
+        self.semaphore.release()
+
+rate_limit_backend = MemoryRateLimitBackend()
+concurrency_limiters = {name: ConcurrencyLimiter(name, limit)
+                        for name, limit in app.config['CONCURRENCY_LIMITS'].items() if limit}
+
+def admission_class(name):
+    """Decorator to put a view in an endpoint class other than the one implied by its method and path"""
+    def decorator(f):
+        f.admission_class = name
+        return f
+    return decorator
+
+def request_admission_class():
+    explicit = getattr(app.view_functions.get(request.endpoint), 'admission_class', None)
+    if explicit:
+        return explicit
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        return 'write'
+    return 'json' if request.path.startswith('/api/') else 'page'
+
+def rate_limit_key():
+    """Logged-in users get their own bucket, anonymous clients share one per IP"""
+    actor_type, actor_id = current_actor()
+    if actor_id is not None:
+        return f'{actor_type}:{actor_id}'
+    return f'ip:{request.remote_addr}'
+
+def admission_rejection(status, retry_after, message):
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': message})
+    else:
+        response = make_response(message)
+        response.mimetype = 'text/plain'
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@app.before_request
+def admit_request():
+    """Shed load before the view runs: 429 past the client's rate, 503 when its class is saturated"""
+    if request.endpoint is None or request.endpoint in ADMISSION_EXEMPT_ENDPOINTS:
+        return None
+    endpoint_class = request_admission_class()
+    
+    if app.config['RATE_LIMIT_ENABLED']:
+        wait = rate_limit_backend.take(rate_limit_key(), app.config['RATE_LIMIT_COSTS'].get(endpoint_class, 1),
+                                       app.config['RATE_LIMIT_PER_SECOND'], app.config['RATE_LIMIT_BURST'], time.time())
+        if wait:
+            ADMISSION_REQUESTS.inc(endpoint_class=endpoint_class, outcome='rate_limited')
+            return admission_rejection(429, wait, 'Too many requests, please slow down.')
+    
+    limiter = concurrency_limiters.get(endpoint_class)
+    if limiter is not None:
+        if not limiter.acquire(app.config['ADMISSION_WAIT_SECONDS']):
+            ADMISSION_REQUESTS.inc(endpoint_class=endpoint_class, outcome='shed')
+            return admission_rejection(503, app.config['ADMISSION_RETRY_AFTER'], 'Server is busy, please retry shortly.')
+        g.admission_limiter = limiter
+    ADMISSION_REQUESTS.inc(endpoint_class=endpoint_class, outcome='admitted')
+
+@app.after_request
+def release_admission_slot(response):
+    limiter = g.pop('admission_limiter', None)
+    if limiter is not None:
+        if response.is_streamed and not response.direct_passthrough:
+            # Generated bodies (exports) do their work while being sent, so hold the slot until close
+            response.call_on_close(limiter.release)
+        else:
+            limiter.release()
+    return response
+
+@app.teardown_request
+def release_admission_slot_on_error(exc):
+    limiter = g.pop('admission_limiter', None)
+    if limiter is not None:
+        limiter.release()
+
+# ==================== CONDITIONAL GET & COMPRESSION ====================
+
+GLOBAL_DATA_VERSION = 0
+
+def _touched_patient_ids(session_):
+    """Collect patient ids whose data is changed by the pending flush, grouped by shard"""
+    touched = {}
+    for obj in list(session_.new) + list(session_.dirty) + list(session_.deleted):
+        if isinstance(obj, Patient):
+            touched.setdefault(0, set()).add(obj.id)
+        elif isinstance(obj, Doctor):
+            touched.setdefault(0, set()).add(GLOBAL_DATA_VERSION)
+        elif getattr(obj, 'patient_id', None) is not None and not isinstance(obj, DataVersion):
+            # Sharded rows bump the copy of data_version in their own shard, inside its transaction
+            shard = shard_router.shard_for_id(obj.id) if obj.__table__.name in SHARDED_TABLES else 0
+            touched.setdefault(shard, set()).add(obj.patient_id)
+    for patient_ids in touched.values():
+        patient_ids.discard(None)
+    return {shard: patient_ids for shard, patient_ids in touched.items() if patient_ids}
+
+def data_version_upsert(patient_ids):
+    """Statement that increments the data version of each patient id"""
+    stmt = sqlite_insert(DataVersion.__table__).values([{'patient_id': pid, 'version': 1} for pid in patient_ids])
+    return stmt.on_conflict_do_update(
+        index_elements=['patient_id'],
+        set_={'version': DataVersion.__table__.c.version + 1}
+    )
+
+@event.listens_for(Session, 'after_flush')
+def track_data_changes(session_, flush_context):
+    """Bump data versions in the same transaction as the change"""
+    for shard, patient_ids in _touched_patient_ids(session_).items():
+        session_.connection(bind_arguments={'bind': shard_router.bind(shard)}).execute(
+            data_version_upsert(patient_ids))
+
+@event.listens_for(Session, 'after_flush')
+def track_patient_shards(session_, flush_context):
+    """Record the shard of each new booking in clinic.db, in the same session"""
+    if shard_router.enabled():
+        shard_router.record_patient_shards(
+            [(obj.patient_id, shard_router.shard_for_id(obj.id)) for obj in session_.new if isinstance(obj, Appointment)],
+            session_.connection(bind_arguments={'bind': db.engine}))
+
+def bump_data_versions(patient_ids=(GLOBAL_DATA_VERSION,)):
+    """Bump data versions explicitly (for bulk SQL that bypasses the ORM), in the active shard"""
+    patient_ids = set(patient_ids)
+    if patient_ids:
+        shard = active_shard.get() if shard_router.enabled() else 0
+        db.session.execute(data_version_upsert(patient_ids),
+                           bind_arguments={'bind': shard_router.bind(shard or 0)})
+
+def patient_etag(patient_id):
+    """Weak ETag for the current endpoint built from data versions, not the body"""
+    versions = []
+    for shard in shard_router.patient_shards(patient_id):
+        rows = db.session.execute(
+            db.select(DataVersion.patient_id, DataVersion.version).where(
+                DataVersion.patient_id.in_([patient_id, GLOBAL_DATA_VERSION])),
+            bind_arguments={'bind': shard_router.bind(shard)}
+        ).all()
+        shard_versions = dict(rows)
+        versions += [str(shard_versions.get(patient_id, 0)), str(shard_versions.get(GLOBAL_DATA_VERSION, 0))]
+    key = '|'.join([
+        app.config['ETAG_SALT'],
+        request.endpoint or '',
+        request.query_string.decode('latin-1'),
+        str(patient_id),
+        *versions,
+        # Views may depend on "today" but never on the time of day (e.g. the dashboard clock is client-side)
+        datetime.now().strftime('%Y-%m-%d'),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def conditional_response(f):
+    """Decorator to answer If-None-Match with 304 before running the view"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Pending flash messages are rendered into the page, so never short-circuit them
+        if request.method != 'GET' or session.get('_flashes'):
+            return f(*args, **kwargs)
+        
+        etag = patient_etag(session.get('patient_id'))
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
+@app.after_request
+def compress_response(response):
+    """Gzip/brotli-compress eligible responses above the size threshold"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'], mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# ==================== UPLOAD PIPELINE ====================
+
+thumbnail_executor = ThreadPoolExecutor(max_workers=app.config['THUMBNAIL_WORKERS'],
+                                        thread_name_prefix='thumbnails')
+
+def thumbnail_name(filename, size):
+    """Thumbnail file name for an upload at the given size"""
+    return f"{os.path.splitext(filename)[0]}_{size}.jpg"
+
+def generate_thumbnails(filename):
+    """Generate fixed-size JPEG thumbnails for an upload (runs in the worker pool)"""
+    if Image is None:
+        return
+    source = os.path.join(PATIENT_UPLOAD_FOLDER, filename)
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            for size in app.config['THUMBNAIL_SIZES']:
+                target = os.path.join(PATIENT_THUMB_FOLDER, thumbnail_name(filename, size))
+                if os.path.exists(target):
+                    continue
+                thumb = ImageOps.fit(img, (size, size))
+                tmp_path = target + '.part'
+                thumb.save(tmp_path, 'JPEG', quality=85, optimize=True)
+                os.replace(tmp_path, target)
+    except Exception as e:
+        app.logger.warning("Thumbnail generation failed for %s: %s", filename, e)
+
+def store_upload(file):
+    """Stream an upload to disk in chunks and store it under its content hash"""
+    ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+    if ext not in app.config['ALLOWED_IMAGE_EXTENSIONS']:
+        raise ValueError(f"Unsupported image type '{ext or file.filename}'")
+    
+    hasher = hashlib.sha256()
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    with tempfile.NamedTemporaryFile(dir=PATIENT_UPLOAD_FOLDER, suffix='.part', delete=False) as tmp:
+        for chunk in iter(lambda: file.stream.read(chunk_size), b''):
+            hasher.update(chunk)
+            tmp.write(chunk)
+    
+    filename = f"{hasher.hexdigest()}{ext}"
+    final_path = os.path.join(PATIENT_UPLOAD_FOLDER, filename)
+    try:
+        # Duplicate content: reuse the stored file, refreshing its mtime so the orphan
+        # sweep's grace period protects it until the new reference is committed
+        os.utime(final_path)
+        os.remove(tmp.name)
+    except FileNotFoundError:
+        os.replace(tmp.name, final_path)
+    
+    thumbnail_executor.submit(generate_thumbnails, filename)
+    return filename
+
+@app.template_global()
+def profile_picture_url(filename, size=None):
+    """URL for a profile picture, using the thumbnail when one is available"""
+    if size and os.path.exists(os.path.join(PATIENT_THUMB_FOLDER, thumbnail_name(filename, size))):
+        return url_for('patient_media_thumbnail', size=size, filename=filename)
+    return url_for('patient_media', filename=filename)
+
+def collect_orphaned_uploads(grace_seconds=None):
+    """Delete uploads and thumbnails no longer referenced by any patient"""
+    if grace_seconds is None:
+        grace_seconds = app.config['UPLOAD_GC_GRACE_SECONDS']
+    cutoff = time.time() - grace_seconds
+    
+    referenced = {row[0] for row in db.session.query(Patient.profile_picture).filter(
+        Patient.profile_picture.isnot(None)
+    ).distinct()}
+    referenced_stems = {os.path.splitext(name)[0] for name in referenced}
+    
+    removed = 0
+    for entry in os.scandir(PATIENT_UPLOAD_FOLDER):
+        if entry.is_file() and entry.name not in referenced and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    for entry in os.scandir(PATIENT_THUMB_FOLDER):
+        stem = entry.name.rsplit('_', 1)[0]
+        if entry.is_file() and stem not in referenced_stems and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+@app.cli.command('gc-uploads')
+def gc_uploads_command():
+    """Remove orphaned profile pictures and thumbnails"""
+    removed = collect_orphaned_uploads()
+    print(f"🧹 Removed {removed} orphaned upload files")
+
+@app.route('/media/patients/<path:filename>')
+def patient_media(filename):
+    return send_from_directory(PATIENT_UPLOAD_FOLDER, filename, conditional=True,
+                               max_age=app.config['MEDIA_MAX_AGE'])
+
+@app.route('/media/patients/<int:size>/<path:filename>')
+def patient_media_thumbnail(size, filename):
+    if size not in app.config['THUMBNAIL_SIZES']:
+        abort(404)
+    return send_from_directory(PATIENT_THUMB_FOLDER, thumbnail_name(filename, size), conditional=True,
+                               max_age=app.config['MEDIA_MAX_AGE'])
+
+@app.after_request
+def cache_media(response):
+    """Mark content-addressed media as immutable"""
+    if request.endpoint in ('patient_media', 'patient_media_thumbnail') and response.status_code in (200, 206):
+        response.headers['Cache-Control'] = f"public, max-age={app.config['MEDIA_MAX_AGE']}, immutable"
+    return response
+
+# ==================== HOSPITAL SHARDING ====================
+
+class ShardRouter:
+    """Maps each hospital to its own SQLite file so sites never contend for one write lock"""
+    def __init__(self):
+        self.hospitals = {}  # hospital name -> shard number
+        self.engines = {}
+        self.lock = threading.Lock()
+    
+    def enabled(self):
+        return app.config['SHARDING_ENABLED']
+    
+    def shard_path(self, number):
+        return os.path.join(app.config['SHARD_FOLDER'], f'hospital_{number}.db')
+    
+    def shard_numbers(self):
+        """Every shard, starting with clinic.db (shard 0) which keeps unassigned and legacy rows"""
+        if not self.enabled():
+            return [0]
+        rows = db.session.query(HospitalShard.hospital, HospitalShard.id).all()
+        pending = db.session.info.get('registered_hospitals', {})
+        self.hospitals.update((hospital, number) for hospital, number in rows if hospital not in pending)
+        return [0] + sorted(number for _, number in rows)
+    
+    def patient_shards(self, patient_id):
+        """clinic.db plus the shards a patient has bookings in"""
+        if not self.enabled():
+            return [0]
+        return [0] + sorted(db.session.execute(
+            db.select(PatientShard.shard_id).where(PatientShard.patient_id == patient_id)
+        ).scalars())
+    
+    def record_patient_shards(self, pairs, connection=None):
+        """Remember (patient_id, shard) pairs; only unseen pairs write to clinic.db"""
+        pairs = {(patient_id, shard) for patient_id, shard in pairs if shard}
+        if not pairs:
+            return
+        execute = (connection or db.session).execute
+        known = set(execute(db.select(PatientShard.patient_id, PatientShard.shard_id).where(
+            PatientShard.patient_id.in_({patient_id for patient_id, _ in pairs}))).all())
+        missing = pairs - known
+        if missing:
+            execute(sqlite_insert(PatientShard.__table__).values(
+                [{'patient_id': patient_id, 'shard_id': shard} for patient_id, shard in missing]
+            ).on_conflict_do_nothing())
+    
+    def shard_for_hospital(self, hospital):
+        """Shard number for a hospital, registering it on first use"""
+        if not self.enabled() or not hospital:
+            return 0
+        number = self.hospitals.get(hospital)
+        if number is None:
+            # Written on the session's own connection: a separate connection would wait for the
+            # clinic.db write lock this session may already hold. Cached once the session commits.
+            db.session.execute(sqlite_insert(HospitalShard.__table__).values(
+                hospital=hospital, created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=['hospital']))
+            number = db.session.execute(
+                db.select(HospitalShard.id).where(HospitalShard.hospital == hospital)
+            ).scalar_one()
+            db.session.info.setdefault('registered_hospitals', {})[hospital] = number
+        return number
+    
+    def shard_for_doctor(self, doctor_id):
+        doctor = db.session.query(Doctor.id, Doctor.current_hospital, Doctor.shard_id).filter(
+            Doctor.id == doctor_id).first()
+        return self.doctor_shard(doctor) if doctor else 0
+    
+    def doctor_shard(self, doctor):
+        """Shard holding a doctor's bookings, pinned on first use so it survives hospital changes"""
+        if not self.enabled():
+            return 0
+        if doctor.shard_id is not None:
+            return doctor.shard_id
+        # Upcoming bookings still in clinic.db keep the doctor there until split-shards moves them
+        with self.use(0):
+            pending = db.session.query(Appointment.id).filter(
+                Appointment.doctor_id == doctor.id,
+                Appointment.date >= date_type.today(),
+                Appointment.status == 'scheduled'
+            ).first()
+        if pending:
+            return 0
+        number = self.shard_for_hospital(doctor.current_hospital)
+        # Pinned in the caller's transaction (see shard_for_hospital); a concurrent pin wins the race
+        db.session.execute(Doctor.__table__.update().where(
+            Doctor.id == doctor.id, Doctor.shard_id.is_(None)
+        ).values(shard_id=number))
+        return db.session.query(Doctor.shard_id).filter(Doctor.id == doctor.id).scalar()
+    
+    def shard_for_id(self, appointment_id):
+        return appointment_id // SHARD_ID_SPAN if self.enabled() else 0
+    
+    def group_ids(self, appointment_ids):
+        """Split appointment ids by the shard encoded in them"""
+        groups = {}
+        for appointment_id in appointment_ids:
+            groups.setdefault(self.shard_for_id(appointment_id), []).append(appointment_id)
+        return groups
+    
+    def bind(self, number):
+        """Engine for a shard number, clinic.db for shard 0"""
+        return self.engine(number) if number else db.engine
+    
+    def engine(self, number):
+        engine = self.engines.get(number)
+        if engine is None:
+            with self.lock:
+                engine = self.engines.get(number) or self._open(number)
+                self.engines[number] = engine
+        return engine
+    
+    def _open(self, number):
+        """Create the shard's tables and seed its id range"""
+        os.makedirs(app.config['SHARD_FOLDER'], exist_ok=True)
+        engine = create_engine(f'sqlite:///{self.shard_path(number)}')
+        sharded = [db.metadata.tables[name] for name in SHARDED_TABLES]
+        # Each shard keeps its own data_version rows so writes never touch clinic.db
+        tables = sharded + [DataVersion.__table__]
+        db.metadata.create_all(engine, tables=tables)
+        add_missing_columns(engine, tables)
+        with engine.begin() as conn:
+            for table in tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            for table in sharded:
+                conn.execute(db.text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+                ), {'name': table.name, 'seq': number * SHARD_ID_SPAN})
+        return engine
+    
+    @contextmanager
+    def use(self, number):
+        """Route appointment statements issued inside the block to one shard"""
+        token = active_shard.set(number)
+        try:
+            yield number
+        finally:
+            active_shard.reset(token)
+    
+    def use_doctor(self, doctor_id):
+        return self.use(self.shard_for_doctor(doctor_id))
+    
+    def use_appointment(self, appointment_id):
+        return self.use(self.shard_for_id(appointment_id))
+    
+    def fan_out(self, fn, shards=None):
+        """Run fn(shard, connection) on every shard in parallel and return {shard: result}"""
+        shards = self.shard_numbers() if shards is None else shards
+        engines = {number: self.bind(number) for number in shards}
+        
+        def run(number):
+            with engines[number].connect() as conn:
+                return fn(number, conn)
+        return dict(zip(shards, shard_executor.map(run, shards)))
+
+shard_router = ShardRouter()
+shard_executor = ThreadPoolExecutor(max_workers=app.config['SHARD_FANOUT_WORKERS'],
+                                    thread_name_prefix='shard-fanout')
+
+@event.listens_for(Session, 'after_commit')
+def cache_registered_hospitals(session_):
+    """Remember hospital shards registered in a transaction only once it has committed"""
+    shard_router.hospitals.update(session_.info.pop('registered_hospitals', {}))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_registered_hospitals(session_, previous_transaction):
+    session_.info.pop('registered_hospitals', None)
+
+class ShardedQuery:
+    """Enough of Query to run an ordered appointment query on several shards and merge the results"""
+    def __init__(self, build, key=None, reverse=False, offset=0, limit=None, shards=None):
+        self.build = build  # returns the Query to run on the active shard
+        self.key = key
+        self.reverse = reverse
+        self._offset = offset
+        self._limit = limit
+        self.shards = shards  # None = every shard
+    
+    def offset(self, offset):
+        return ShardedQuery(self.build, self.key, self.reverse, offset, self._limit, self.shards)
+    
+    def limit(self, limit):
+        return ShardedQuery(self.build, self.key, self.reverse, self._offset, limit, self.shards)
+    
+    def shard_list(self):
+        return shard_router.shard_numbers() if self.shards is None else self.shards
+    
+    def all(self):
+        # Each shard only has to cover offset + limit rows of the merged order
+        per_shard = None if self._limit is None else self._offset + self._limit
+        results = []
+        for number in self.shard_list():
+            with shard_router.use(number):
+                query = self.build()
+                results.append((query if per_shard is None else query.limit(per_shard)).all())
+        merged = heapq.merge(*results, key=self.key, reverse=self.reverse)
+        return list(itertools.islice(merged, self._offset, per_shard))
+    
+    def first(self):
+        return next(iter(self.limit(1).all()), None)
+    
+    def count(self):
+        total = 0
+        for number in self.shard_list():
+            with shard_router.use(number):
+                total += self.build().order_by(None).count()
+        return total
+
+def split_shards(batch_size=1000):
+    """Move appointments from clinic.db into their doctor's shard (run with the app stopped)"""
+    if not shard_router.enabled():
+        raise click.ClickException("Set CLINIC_SHARDING=1 to enable per-hospital shards first")
+    table = Appointment.__table__
+    columns = [c.name for c in table.columns if c.name != 'id']
+    # Pinned doctors keep their shard, the rest go to their current hospital's shard
+    targets = {}
+    for doctor in db.session.query(Doctor.id, Doctor.current_hospital, Doctor.shard_id).all():
+        number = doctor.shard_id if doctor.shard_id is not None else shard_router.shard_for_hospital(doctor.current_hospital)
+        if number:
+            targets.setdefault(number, []).append(doctor.id)
+    moved = 0
+    for number, doctor_ids in targets.items():
+        while True:
+            with shard_router.use(0):
+                rows = db.session.execute(
+                    db.select(table).where(table.c.doctor_id.in_(doctor_ids)).order_by(table.c.id).limit(batch_size)
+                ).all()
+            if not rows:
+                break
+            # New ids come from the shard's range so they identify the shard from now on
+            with shard_router.engine(number).begin() as conn:
+                new_ids = conn.execute(
+                    table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                    [{name: row._mapping[name] for name in columns} for row in rows]
+                ).scalars().all()
+            id_map = dict(zip([row.id for row in rows], new_ids))
+            
+            linked = db.session.query(WaitlistEntry.id, WaitlistEntry.appointment_id).filter(
+                WaitlistEntry.appointment_id.in_(id_map)
+            ).all()
+            if linked:
+                db.session.execute(WaitlistEntry.__table__.update().where(
+                    WaitlistEntry.id == db.bindparam('entry_id')
+                ).values(appointment_id=db.bindparam('new_id')),
+                    [{'entry_id': entry_id, 'new_id': id_map[old_id]} for entry_id, old_id in linked])
+            with shard_router.use(0):
+                db.session.execute(table.delete().where(table.c.id.in_(id_map)))
+                bump_data_versions(row.patient_id for row in rows)
+                shard_router.record_patient_shards((row.patient_id, number) for row in rows)
+                db.session.commit()
+            moved += len(rows)
+        db.session.execute(Doctor.__table__.update().where(Doctor.id.in_(doctor_ids)).values(shard_id=number))
+        db.session.commit()
+    return moved
+
+def backfill_patient_shards(batch_size=1000):
+    """Fill patient_shard from the shards themselves, for databases sharded before it existed"""
+    if not shard_router.enabled() or db.session.query(PatientShard.patient_id).first() is not None:
+        return 0
+    table = Appointment.__table__
+    found = shard_router.fan_out(
+        lambda shard, conn: conn.execute(db.select(table.c.patient_id).distinct()).scalars().all(),
+        shard_router.shard_numbers()[1:])
+    rows = [{'patient_id': patient_id, 'shard_id': shard} for shard, patient_ids in found.items()
+            for patient_id in patient_ids]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(sqlite_insert(PatientShard.__table__).values(rows[start:start + batch_size])
+                           .on_conflict_do_nothing())
+    db.session.commit()
+    return len(rows)
+
+@app.cli.command('split-shards')
+@click.option('--batch-size', default=1000, show_default=True)
+def split_shards_command(batch_size):
+    """Move existing appointments into per-hospital shard databases"""
+    ensure_schema()
+    print(f"🏥 Moved {split_shards(batch_size)} appointments into hospital shards")
+
+@app.route('/api/admin/appointments')
+@admin_login_required
+def admin_appointments_api():
+    """Appointments across every hospital, queried on all shards in parallel and merged by time"""
+    table = Appointment.__table__
+    query = db.select(table)
+    if request.args.get('date'):
+        query = query.where(table.c.date == datetime.strptime(request.args['date'], '%Y-%m-%d').date())
+    if request.args.get('status'):
+        query = query.where(table.c.status == request.args['status'])
+    shards = None
+    if request.args.get('hospital'):
+        doctors = Doctor.query.filter_by(current_hospital=request.args['hospital']).all()
+        query = query.where(table.c.doctor_id.in_([doctor.id for doctor in doctors]))
+        # Doctors who moved hospital keep their bookings in the shard they were pinned to
+        shards = sorted({0} | {shard_router.doctor_shard(doctor) for doctor in doctors})
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    query = query.order_by(table.c.date, table.c.time).limit(limit)
+    
+    results = shard_router.fan_out(lambda shard, conn: conn.execute(query).all(), shards)
+    rows = list(itertools.islice(heapq.merge(*results.values(), key=lambda r: (r.date, r.time)), limit))
+    
+    patients = dict(db.session.query(Patient.id, Patient.name).filter(
+        Patient.id.in_({row.patient_id for row in rows})
+    ).all())
+    doctors = {row.id: row for row in db.session.query(Doctor.id, Doctor.name, Doctor.current_hospital).filter(
+        Doctor.id.in_({row.doctor_id for row in rows})
+    )}
+    return jsonify([{
+        'id': row.id,
+        'date': row.date.isoformat(),
+        'time': row.time,
+        'status': row.status,
+        'priority': row.priority,
+        'patient': patients.get(row.patient_id),
+        'doctor': doctors[row.doctor_id].name if row.doctor_id in doctors else None,
+        'hospital': doctors[row.doctor_id].current_hospital if row.doctor_id in doctors else None
+    } for row in rows])
+
+@app.route('/api/admin/hospitals/stats')
+@admin_login_required
+def admin_hospital_stats_api():
+    """Appointment counts per hospital and status, aggregated on every shard in parallel"""
+    table = Appointment.__table__
+    query = db.select(table.c.doctor_id, table.c.status, db.func.count()).group_by(table.c.doctor_id, table.c.status)
+    results = shard_router.fan_out(lambda shard, conn: conn.execute(query).all())
+    
+    hospitals = dict(db.session.query(Doctor.id, Doctor.current_hospital).all())
+    stats = {}
+    for rows in results.values():
+        for doctor_id, status, count in rows:
+            counts = stats.setdefault(hospitals.get(doctor_id) or 'Unassigned', {})
+            counts[status] = counts.get(status, 0) + count
+    return jsonify(stats)
+
+# ==================== ARCHIVAL ====================
+
+ARCHIVED_APPOINTMENT_STATUSES = ('completed', 'cancelled', 'no-show')
+
+def archive_cutoff(horizon_days=None):
+    """Rows older than this live in the archive tables"""
+    if horizon_days is None:
+        horizon_days = app.config['ARCHIVE_HORIZON_DAYS']
+    return datetime.now() - timedelta(days=horizon_days)
+
+def _archive_batches(model, archive_model, condition, batch_size, shard=0):
+    """Move rows matching condition into the archive table, one batch per transaction"""
+    columns = [c.name for c in model.__table__.columns]
+    archive_columns = columns + ['archived_at']
+    moved = 0
+    while True:
+        with shard_router.use(shard):
+            rows = db.session.query(model.id, model.patient_id).filter(condition).limit(batch_size).all()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            if shard:
+                # The archive lives in clinic.db, so copy rows over (idempotently) instead of INSERT ... SELECT
+                values = db.session.query(*[model.__table__.c[name] for name in columns]).filter(model.id.in_(ids)).all()
+                archived_at = datetime.utcnow()
+                db.session.execute(sqlite_insert(archive_model.__table__).on_conflict_do_nothing(),
+                                   [dict(row._mapping, archived_at=archived_at) for row in values])
+            else:
+                source = db.select(*[model.__table__.c[name] for name in columns],
+                                   db.literal(datetime.utcnow()).label('archived_at')).where(model.id.in_(ids))
+                db.session.execute(archive_model.__table__.insert().from_select(archive_columns, source))
+            db.session.execute(model.__table__.delete().where(model.id.in_(ids)))
+            bump_data_versions(row[1] for row in rows)
+            db.session.commit()
+        moved += len(ids)
+    return moved
+
+def archive_old_rows(cutoff=None, batch_size=None):
+    """Move finished appointments and vitals older than cutoff (default: the horizon) to the archive tables"""
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    
+    return {
+        'appointments': sum(_archive_batches(
+            Appointment, AppointmentArchive,
+            db.and_(Appointment.date < cutoff.date(), Appointment.status.in_(ARCHIVED_APPOINTMENT_STATUSES)),
+            batch_size, number
+        ) for number in shard_router.shard_numbers()),
+        'vitals': _archive_batches(Vitals, VitalsArchive, Vitals.date < cutoff, batch_size),
+    }
+
+def paginate_history(hot_query, archive_query, page, per_page):
+    """Page through hot rows first and continue into the archive only when they run out"""
+    offset = (page - 1) * per_page
+    items = hot_query.offset(offset).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        hot_total = offset + len(items) if items else hot_query.count()
+        archive_offset = max(0, offset - hot_total)
+        items += archive_query.offset(archive_offset).limit(per_page + 1 - len(items)).all()
+    return items[:per_page], len(items) > per_page
+
+@app.cli.command('archive-old-data')
+@click.option('--horizon-days', type=int, default=None, help='Defaults to ARCHIVE_HORIZON_DAYS')
+@click.option('--batch-size', type=int, default=None, help='Defaults to ARCHIVE_BATCH_SIZE')
+def archive_old_data_command(horizon_days, batch_size):
+    """Move old appointments and vitals into the archive tables"""
+    # Readers skip the archive for windows newer than ARCHIVE_HORIZON_DAYS, so never archive closer than that
+    if horizon_days is not None and horizon_days < app.config['ARCHIVE_HORIZON_DAYS']:
+        raise click.BadParameter(f"must be at least ARCHIVE_HORIZON_DAYS ({app.config['ARCHIVE_HORIZON_DAYS']})",
+                                 param_hint='--horizon-days')
+    ensure_schema()
+    moved = archive_old_rows(archive_cutoff(horizon_days), batch_size)
+    print(f"📦 Archived {moved['appointments']} appointments and {moved['vitals']} vitals")
+
 # ==================== EXISTING ROUTES (Keep as is) ====================
 
 @app.route('/')
@@ -334,9 +1629,9 @@ def login_patient():
         email = request.form['email']
         password = request.form['password']
         
-        patient = Patient.query.filter_by(email=email, password=password).first()
+        patient = Patient.query.filter_by(email=email).first()
         
-        if patient:
+        if patient and verify_password(patient.password, password):
             session.pop('doctor', None)
             session.pop('admin', None)
             session['patient'] = patient.name
@@ -357,9 +1652,9 @@ def login_doctor():
         email = request.form['email']
         password = request.form['password']
         
-        doctor = Doctor.query.filter_by(email=email, password=password).first()
+        doctor = Doctor.query.filter_by(email=email).first()
         
-        if doctor:
+        if doctor and verify_password(doctor.password, password):
             session.pop('patient', None)
             session.pop('admin', None)
             session['doctor'] = doctor.name
@@ -425,17 +1720,19 @@ def logout():
 
 @app.route('/patient/dashboard')
 @patient_login_required
+@conditional_response
 def patient_dashboard():
     patient_id = session.get('patient_id')
     patient = Patient.query.get_or_404(patient_id)
     
     # Get upcoming appointments
     today = datetime.now().date()
-    upcoming_appointments = Appointment.query.filter(
+    upcoming_appointments = ShardedQuery(lambda: Appointment.query.filter(
         Appointment.patient_id == patient_id,
         Appointment.date >= today,
         Appointment.status == 'scheduled'
-    ).order_by(Appointment.date, Appointment.time).limit(5).all()
+    ).order_by(Appointment.date, Appointment.time), key=lambda a: (a.date, a.time),
+        shards=shard_router.patient_shards(patient_id)).limit(5).all()
     
     # Get recent medical records
     recent_records = MedicalRecord.query.filter_by(
@@ -474,36 +1771,36 @@ def book_appointment():
     
     if request.method == 'POST':
         try:
-            doctor_id = request.form.get('doctor_id')
+            doctor_id = int(request.form.get('doctor_id'))
             date = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
             time = request.form.get('time')
             symptoms = request.form.get('symptoms')
             priority = request.form.get('priority', 'normal')
             
-            # Check if slot is available
-            existing = Appointment.query.filter_by(
-                doctor_id=doctor_id,
-                date=date,
-                time=time,
-                status='scheduled'
-            ).first()
-            
-            if existing:
-                flash('This time slot is already booked. Please choose another time.', 'error')
-                return redirect(url_for('book_appointment'))
-            
-            appointment = Appointment(
-                patient_id=patient_id,
-                doctor_id=doctor_id,
-                date=date,
-                time=time,
-                symptoms=symptoms,
-                priority=priority,
-                status='scheduled'
-            )
-            
-            db.session.add(appointment)
-            db.session.commit()
+            # The doctor's hospital shard holds all of their bookings
+            with shard_router.use_doctor(doctor_id):
+                # Check if slot is available (booked, or held for a waitlist offer)
+                if not slot_is_free(doctor_id, date, time):
+                    if request.form.get('join_waitlist'):
+                        join_waitlist(patient_id, doctor_id, date, priority, symptoms)
+                        flash('This time slot is already booked. You have been added to the waitlist.', 'info')
+                        return redirect(url_for('view_appointments'))
+                    flash('This time slot is already booked. Please choose another time.', 'error')
+                    return redirect(url_for('book_appointment'))
+                
+                appointment = Appointment(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    date=date,
+                    time=time,
+                    symptoms=symptoms,
+                    priority=priority,
+                    status='scheduled'
+                )
+                
+                db.session.add(appointment)
+                db.session.commit()
+                appointment_scheduler.schedule(appointment.id, appointment.date, appointment.time)
             
             flash('Appointment booked successfully!', 'success')
             return redirect(url_for('view_appointments'))
@@ -526,31 +1823,55 @@ def book_appointment():
 @patient_login_required
 def view_appointments():
     patient_id = session.get('patient_id')
+    page = max(request.args.get('page', 1, type=int), 1)
+    today = datetime.now().date()
+    shards = shard_router.patient_shards(patient_id)
     
-    all_appointments = Appointment.query.filter_by(
-        patient_id=patient_id
-    ).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    upcoming = ShardedQuery(lambda: Appointment.query.filter(
+        Appointment.patient_id == patient_id,
+        Appointment.date >= today,
+        Appointment.status == 'scheduled'
+    ).order_by(Appointment.date.desc(), Appointment.time.desc()), key=lambda a: (a.date, a.time), reverse=True,
+        shards=shards).all()
     
-    today = datetime.now().date()
+    # Past appointments: hot table first, older history from the archive
+    past_hot = ShardedQuery(lambda: Appointment.query.filter(
+        Appointment.patient_id == patient_id,
+        db.or_(Appointment.date < today, Appointment.status != 'scheduled')
+    ).order_by(Appointment.date.desc(), Appointment.time.desc()), key=lambda a: (a.date, a.time), reverse=True,
+        shards=shards)
+    past_archive = AppointmentArchive.query.filter_by(
+        patient_id=patient_id
+    ).order_by(AppointmentArchive.date.desc(), AppointmentArchive.time.desc())
+    past, has_next = paginate_history(past_hot, past_archive, page, app.config['HISTORY_PAGE_SIZE'])
     
-    upcoming = [a for a in all_appointments if a.date >= today and a.status == 'scheduled']
-    past = [a for a in all_appointments if a.date < today or a.status in ['completed', 'cancelled']]
+    waitlist = WaitlistEntry.query.filter(
+        WaitlistEntry.patient_id == patient_id,
+        WaitlistEntry.status.in_(['waiting', 'offered'])
+    ).order_by(WaitlistEntry.date).all()
     
     return render_template('patient/view-appointments.html',
                          upcoming_appointments=upcoming,
-                         past_appointments=past)
+                         past_appointments=past,
+                         waitlist_entries=waitlist,
+                         page=page,
+                         has_next=has_next)
 
 @app.route('/patient/appointment/<int:appointment_id>/cancel', methods=['POST'])
 @patient_login_required
 def cancel_appointment(appointment_id):
     patient_id = session.get('patient_id')
-    appointment = Appointment.query.filter_by(
-        id=appointment_id,
-        patient_id=patient_id
-    ).first_or_404()
-    
-    appointment.status = 'cancelled'
-    db.session.commit()
+    with shard_router.use_appointment(appointment_id):
+        appointment = Appointment.query.filter_by(
+            id=appointment_id,
+            patient_id=patient_id
+        ).first_or_404()
+        
+        appointment.status = 'cancelled'
+        # Offer the slot in the same transaction so it cannot be lost between the two
+        if appointment.date >= datetime.now().date():
+            offer_slot(appointment.doctor_id, appointment.date, appointment.time)
+        db.session.commit()
     
     flash('Appointment cancelled successfully.', 'success')
     return redirect(url_for('view_appointments'))
@@ -568,6 +1889,7 @@ def medical_records():
 
 @app.route('/patient/vitals', methods=['GET', 'POST'])
 @patient_login_required
+@conditional_response
 def patient_vitals():
     patient_id = session.get('patient_id')
     
@@ -592,6 +1914,8 @@ def patient_vitals():
             )
             
             db.session.add(vitals)
+            db.session.flush()
+            update_vitals_stats(vitals)
             db.session.commit()
             
             # Check for alerts
@@ -608,12 +1932,13 @@ def patient_vitals():
             db.session.rollback()
             flash(f'Error recording vitals: {str(e)}', 'error')
     
-    # GET request
-    all_vitals = Vitals.query.filter_by(
-        patient_id=patient_id
-    ).order_by(Vitals.date.desc()).all()
+    # GET request: hot table first, older history from the archive
+    page = max(request.args.get('page', 1, type=int), 1)
+    hot = Vitals.query.filter_by(patient_id=patient_id).order_by(Vitals.date.desc())
+    archive = VitalsArchive.query.filter_by(patient_id=patient_id).order_by(VitalsArchive.date.desc())
+    vitals_list, has_next = paginate_history(hot, archive, page, app.config['HISTORY_PAGE_SIZE'])
     
-    return render_template('patient/vitals.html', vitals_list=all_vitals)
+    return render_template('patient/vitals.html', vitals_list=vitals_list, page=page, has_next=has_next)
 
 @app.route('/patient/prescriptions')
 @patient_login_required
@@ -654,9 +1979,7 @@ def patient_profile():
             if 'profile_picture' in request.files:
                 file = request.files['profile_picture']
                 if file and file.filename:
-                    filename = secure_filename(f"patient_{patient_id}_{file.filename}")
-                    file.save(os.path.join(PATIENT_UPLOAD_FOLDER, filename))
-                    patient.profile_picture = filename
+                    patient.profile_picture = store_upload(file)
             
             # Change password
             if request.form.get('new_password'):
@@ -670,7 +1993,228 @@ def patient_profile():
             db.session.rollback()
             flash(f'Error updating profile: {str(e)}', 'error')
     
-    return render_template('patient/profile.html', patient=patient)
+    appointment_count = ShardedQuery(lambda: Appointment.query.filter_by(patient_id=patient_id),
+                                     shards=shard_router.patient_shards(patient_id)).count()
+    return render_template('patient/profile.html', patient=patient, appointment_count=appointment_count)
+
+# ==================== CANCELLATION WAITLIST ====================
+
+PRIORITY_RANK = {'emergency': 1, 'urgent': 2, 'normal': 3}
+
+def offer_slot(doctor_id, date, time_text, now=None):
+    """Offer a freed slot to the head of the doctor's waitlist for that day (caller commits)"""
+    now = now or datetime.now()
+    if date < now.date():
+        return None
+    while True:
+        # (doctor_id, date, status, priority_rank, created_at) index gives the head directly
+        head = db.session.query(WaitlistEntry.id, WaitlistEntry.patient_id).filter(
+            WaitlistEntry.doctor_id == doctor_id,
+            WaitlistEntry.date == date,
+            WaitlistEntry.status == 'waiting'
+        ).order_by(WaitlistEntry.priority_rank, WaitlistEntry.created_at).first()
+        if head is None:
+            return None
+        claimed = db.session.execute(
+            WaitlistEntry.__table__.update().where(
+                WaitlistEntry.id == head.id, WaitlistEntry.status == 'waiting'
+            ).values(status='offered', offered_time=time_text,
+                     offer_expires_at=now + timedelta(minutes=app.config['WAITLIST_HOLD_MINUTES']))
+        ).rowcount
+        if claimed:
+            bump_data_versions([head.patient_id])
+            queue_offer_notification(head.id)
+            return head.id
+
+def queue_offer_notification(entry_id):
+    """Prepare the offer message; it goes to the reminder sink once the offer is committed"""
+    entry_id, date, time_text, expires_at, patient_name, contact, email, doctor_name = db.session.query(
+        WaitlistEntry.id, WaitlistEntry.date, WaitlistEntry.offered_time, WaitlistEntry.offer_expires_at,
+        Patient.name, Patient.contact, Patient.email, Doctor.name
+    ).join(Patient, Patient.id == WaitlistEntry.patient_id).join(
+        Doctor, Doctor.id == WaitlistEntry.doctor_id
+    ).filter(WaitlistEntry.id == entry_id).one()
+    db.session.info.setdefault('waitlist_offers', []).append({
+        'type': 'waitlist_offer',
+        'waitlist_entry_id': entry_id,
+        'patient': patient_name,
+        'patient_contact': contact,
+        'patient_email': email,
+        'doctor': doctor_name,
+        'start': f"{date.isoformat()} {time_text}",
+        'expires_at': expires_at.isoformat(),
+    })
+
+@event.listens_for(Session, 'after_commit')
+def deliver_offer_notifications(session_):
+    """Tell patients about their offers without waiting for them to open a page"""
+    for offer in session_.info.pop('waitlist_offers', []):
+        try:
+            appointment_scheduler.sink.deliver(offer)
+        except Exception:
+            app.logger.exception("Could not deliver waitlist offer %s", offer['waitlist_entry_id'])
+
+@event.listens_for(Session, 'after_soft_rollback')
+def drop_offer_notifications(session_, previous_transaction):
+    session_.info.pop('waitlist_offers', None)
+
+def live_offer(now=None):
+    """Filter for waitlist offers that still hold their slot"""
+    return db.and_(WaitlistEntry.status == 'offered', WaitlistEntry.offer_expires_at > (now or datetime.now()))
+
+def slot_is_free(doctor_id, date, time_text, exclude_entry_id=None):
+    """A slot is taken by a scheduled appointment or held by an outstanding waitlist offer"""
+    held = WaitlistEntry.query.filter(
+        WaitlistEntry.doctor_id == doctor_id,
+        WaitlistEntry.date == date,
+        WaitlistEntry.offered_time == time_text,
+        live_offer()
+    )
+    if exclude_entry_id is not None:
+        held = held.filter(WaitlistEntry.id != exclude_entry_id)
+    if held.first() is not None:
+        return False
+    with shard_router.use_doctor(doctor_id):
+        return Appointment.query.filter_by(doctor_id=doctor_id, date=date, time=time_text,
+                                           status='scheduled').first() is None
+
+def expire_waitlist_offers(now=None):
+    """Pass lapsed offers on to the next entry and drop waitlists for past days"""
+    now = now or datetime.now()
+    lapsed = WaitlistEntry.query.filter(
+        WaitlistEntry.status == 'offered',
+        WaitlistEntry.offer_expires_at < now
+    ).limit(app.config['SCHEDULER_BATCH_SIZE']).all()
+    for entry in lapsed:
+        entry.status = 'expired'
+        if slot_is_free(entry.doctor_id, entry.date, entry.offered_time, exclude_entry_id=entry.id):
+            offer_slot(entry.doctor_id, entry.date, entry.offered_time, now)
+    
+    stale = db.session.query(WaitlistEntry.id, WaitlistEntry.patient_id).filter(
+        WaitlistEntry.status == 'waiting',
+        WaitlistEntry.date < now.date()
+    ).limit(app.config['SCHEDULER_BATCH_SIZE']).all()
+    if stale:
+        db.session.execute(WaitlistEntry.__table__.update().where(
+            WaitlistEntry.id.in_([row[0] for row in stale])
+        ).values(status='expired'))
+        bump_data_versions(row[1] for row in stale)
+    db.session.commit()
+    return len(lapsed) + len(stale)
+
+def join_waitlist(patient_id, doctor_id, date, priority='normal', symptoms=None):
+    """Add a patient to a doctor's waitlist for a day, returning (entry, created)"""
+    if db.session.get(Doctor, doctor_id) is None:
+        raise ValueError('Unknown doctor.')
+    if date < datetime.now().date():
+        raise ValueError('Cannot join the waitlist for a past day.')
+    existing = WaitlistEntry.query.filter(
+        WaitlistEntry.patient_id == patient_id,
+        WaitlistEntry.doctor_id == doctor_id,
+        WaitlistEntry.date == date,
+        WaitlistEntry.status.in_(['waiting', 'offered'])
+    ).first()
+    if existing:
+        return existing, False
+    entry = WaitlistEntry(patient_id=patient_id, doctor_id=doctor_id, date=date, priority=priority,
+                          priority_rank=PRIORITY_RANK.get(priority, 3), symptoms=symptoms)
+    db.session.add(entry)
+    db.session.commit()
+    return entry, True
+
+@app.route('/patient/waitlist/join', methods=['POST'])
+@patient_login_required
+def join_waitlist_route():
+    patient_id = session.get('patient_id')
+    try:
+        date = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
+        _, created = join_waitlist(patient_id, int(request.form.get('doctor_id')), date,
+                                   request.form.get('priority', 'normal'), request.form.get('symptoms'))
+        if created:
+            flash('You have been added to the waitlist. We will offer you a slot if one frees up.', 'success')
+        else:
+            flash('You are already on the waitlist for this doctor and day.', 'info')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error joining waitlist: {str(e)}', 'error')
+    return redirect(url_for('view_appointments'))
+
+@app.route('/patient/waitlist/<int:entry_id>/accept', methods=['POST'])
+@patient_login_required
+def accept_waitlist_offer(entry_id):
+    patient_id = session.get('patient_id')
+    entry = WaitlistEntry.query.filter_by(id=entry_id, patient_id=patient_id, status='offered').first_or_404()
+    
+    if entry.offer_expires_at < datetime.now():
+        entry.status = 'expired'
+        offer_slot(entry.doctor_id, entry.date, entry.offered_time)
+        db.session.commit()
+        flash('Sorry, this offer has expired.', 'error')
+        return redirect(url_for('view_appointments'))
+    
+    if not slot_is_free(entry.doctor_id, entry.date, entry.offered_time, exclude_entry_id=entry.id):
+        entry.status = 'expired'
+        db.session.commit()
+        flash('Sorry, this slot has already been taken.', 'error')
+        return redirect(url_for('view_appointments'))
+    
+    with shard_router.use_doctor(entry.doctor_id):
+        appointment = Appointment(
+            patient_id=patient_id,
+            doctor_id=entry.doctor_id,
+            date=entry.date,
+            time=entry.offered_time,
+            symptoms=entry.symptoms,
+            priority=entry.priority,
+            status='scheduled'
+        )
+        db.session.add(appointment)
+        db.session.flush()
+        entry.status = 'accepted'
+        entry.appointment_id = appointment.id
+        db.session.commit()
+        appointment_scheduler.schedule(appointment.id, appointment.date, appointment.time)
+    
+    flash('Appointment booked from the waitlist!', 'success')
+    return redirect(url_for('view_appointments'))
+
+@app.route('/patient/waitlist/<int:entry_id>/decline', methods=['POST'])
+@patient_login_required
+def decline_waitlist_offer(entry_id):
+    patient_id = session.get('patient_id')
+    entry = WaitlistEntry.query.filter(
+        WaitlistEntry.id == entry_id,
+        WaitlistEntry.patient_id == patient_id,
+        WaitlistEntry.status.in_(['waiting', 'offered'])
+    ).first_or_404()
+    
+    was_offered = entry.status == 'offered'
+    entry.status = 'declined'
+    if was_offered:
+        offer_slot(entry.doctor_id, entry.date, entry.offered_time)
+    db.session.commit()
+    
+    flash('You have left the waitlist.', 'info')
+    return redirect(url_for('view_appointments'))
+
+@app.route('/api/patient/waitlist')
+@patient_login_required
+def waitlist_api():
+    patient_id = session.get('patient_id')
+    entries = WaitlistEntry.query.filter(
+        WaitlistEntry.patient_id == patient_id,
+        WaitlistEntry.status.in_(['waiting', 'offered'])
+    ).order_by(WaitlistEntry.date).all()
+    
+    return jsonify([{
+        'id': e.id,
+        'doctor': e.doctor.name,
+        'date': e.date.strftime('%Y-%m-%d'),
+        'priority': e.priority,
+        'status': e.status,
+        'offered_time': e.offered_time,
+        'offer_expires_at': e.offer_expires_at.isoformat() if e.offer_expires_at else None
+    } for e in entries])
 
 # ==================== API ROUTES ====================
 
@@ -687,17 +2231,34 @@ def available_doctors():
     
     doctors = query.all()
     
+    # One query per hospital shard instead of one per doctor
+    booked = {}
+    if date_str:
+        date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        by_shard = {}
+        for doctor in doctors:
+            by_shard.setdefault(shard_router.doctor_shard(doctor), []).append(doctor.id)
+        for number, doctor_ids in by_shard.items():
+            with shard_router.use(number):
+                rows = db.session.query(Appointment.doctor_id, Appointment.time).filter(
+                    Appointment.doctor_id.in_(doctor_ids),
+                    Appointment.date == date,
+                    Appointment.status == 'scheduled'
+                ).all()
+            for doctor_id, time_text in rows:
+                booked.setdefault(doctor_id, []).append(time_text)
+        # Slots held for a waitlist offer are not bookable either
+        held = db.session.query(WaitlistEntry.doctor_id, WaitlistEntry.offered_time).filter(
+            WaitlistEntry.doctor_id.in_([doctor.id for doctor in doctors]),
+            WaitlistEntry.date == date,
+            live_offer()
+        ).all()
+        for doctor_id, time_text in held:
+            booked.setdefault(doctor_id, []).append(time_text)
+    
     result = []
     for doctor in doctors:
-        booked_slots = []
-        if date_str:
-            date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            appointments = Appointment.query.filter_by(
-                doctor_id=doctor.id,
-                date=date,
-                status='scheduled'
-            ).all()
-            booked_slots = [a.time for a in appointments]
+        booked_slots = booked.get(doctor.id, [])
         
         result.append({
             'id': doctor.id,
@@ -713,16 +2274,25 @@ def available_doctors():
 
 @app.route('/api/patient/vitals')
 @patient_login_required
+@conditional_response
 def vitals_api():
     patient_id = session.get('patient_id')
     days = request.args.get('days', 30, type=int)
     
-    start_date = datetime.now() - timedelta(days=days)
+    # Whole days only: the ETag covers the date, not the time of day
+    start_date = datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
     vitals = Vitals.query.filter(
         Vitals.patient_id == patient_id,
         Vitals.date >= start_date
     ).order_by(Vitals.date).all()
     
+    # Only touch the archive when the window reaches past the horizon
+    if start_date < archive_cutoff():
+        vitals = VitalsArchive.query.filter(
+            VitalsArchive.patient_id == patient_id,
+            VitalsArchive.date >= start_date
+        ).order_by(VitalsArchive.date).all() + vitals
+    
     data = {
         'dates': [],
         'heart_rate': [],
@@ -748,13 +2318,15 @@ def vitals_api():
 
 @app.route('/api/patient/appointments')
 @patient_login_required
+@conditional_response
 def appointments_api():
     patient_id = session.get('patient_id')
     
-    appointments = Appointment.query.filter_by(
+    appointments = ShardedQuery(lambda: Appointment.query.filter_by(
         patient_id=patient_id,
         status='scheduled'
-    ).order_by(Appointment.date, Appointment.time).all()
+    ).order_by(Appointment.date, Appointment.time), key=lambda a: (a.date, a.time),
+        shards=shard_router.patient_shards(patient_id)).all()
     
     data = []
     priority_order = {'emergency': 1, 'urgent': 2, 'normal': 3}
@@ -774,10 +2346,215 @@ def appointments_api():
     
     return jsonify(data)
 
+# ==================== VITALS STATISTICS ====================
+
+# Vitals column -> (API name, normal range or None)
+TRACKED_VITALS = {
+    'heart_rate': ('heart_rate', (60, 100)),
+    'blood_pressure_systolic': ('bp_systolic', (90, 140)),
+    'blood_pressure_diastolic': ('bp_diastolic', (60, 90)),
+    'temperature': ('temperature', (97, 100.4)),
+    'oxygen_saturation': ('oxygen_saturation', (95, 100)),
+    'weight': ('weight', None),
+    'bmi': ('bmi', (18.5, 25)),
+}
+TREND_WINDOWS = (7, 30, 90)
+STABLE_SLOPE = 0.1  # per day, same threshold as MedicalDataAnalyzer.calculateLinearTrend
+
+def regression_slope(n, sum_x, sum_y, sum_xx, sum_xy):
+    """Least-squares slope from running sums"""
+    denominator = n * sum_xx - sum_x * sum_x
+    if n < 2 or abs(denominator) < 1e-12:
+        return 0.0
+    return (n * sum_xy - sum_x * sum_y) / denominator
+
+def trend_direction(slope):
+    if abs(slope) < STABLE_SLOPE:
+        return 'stable'
+    return 'increasing' if slope > 0 else 'decreasing'
+
+def update_vitals_stats(vitals, cache=None):
+    """Fold one new reading into the running statistics (O(1), caller commits)
+    
+    cache holds rows created during a rebuild, which starts from empty tables.
+    """
+    taken_at = vitals.date or datetime.utcnow()
+    day = taken_at.date()
+    
+    def load(model, key):
+        return cache.get((model, key)) if cache is not None else db.session.get(model, key)
+    
+    def add(model, key, row):
+        db.session.add(row)
+        if cache is not None:
+            cache[(model, key)] = row
+        return row
+    
+    for column in TRACKED_VITALS:
+        value = getattr(vitals, column)
+        if value is None:
+            continue
+        value = float(value)
+        
+        key = (vitals.patient_id, column)
+        stats = load(VitalsStats, key)
+        if stats is None:
+            stats = add(VitalsStats, key, VitalsStats(
+                patient_id=vitals.patient_id, vital=column, origin=taken_at, count=0, mean=0.0, m2=0.0,
+                sum_x=0.0, sum_y=0.0, sum_xx=0.0, sum_xy=0.0, min_value=value, max_value=value
+            ))
+        
+        # Welford's online mean/variance
+        stats.count += 1
+        delta = value - stats.mean
+        stats.mean += delta / stats.count
+        stats.m2 += delta * (value - stats.mean)
+        
+        # Regression sums with x in days since the first reading
+        x = (taken_at - stats.origin).total_seconds() / 86400
+        stats.sum_x += x
+        stats.sum_y += value
+        stats.sum_xx += x * x
+        stats.sum_xy += x * value
+        stats.min_value = min(stats.min_value, value)
+        stats.max_value = max(stats.max_value, value)
+        if stats.last_at is None or taken_at >= stats.last_at:
+            stats.last_value = value
+            stats.last_at = taken_at
+        
+        key = (vitals.patient_id, column, day)
+        bucket = load(VitalsDailyStats, key)
+        if bucket is None:
+            add(VitalsDailyStats, key, VitalsDailyStats(patient_id=vitals.patient_id, vital=column, day=day,
+                                                        count=1, total=value, min_value=value, max_value=value))
+        else:
+            bucket.count += 1
+            bucket.total += value
+            bucket.min_value = min(bucket.min_value, value)
+            bucket.max_value = max(bucket.max_value, value)
+
+def window_summary(buckets, today, days):
+    """Combine daily buckets into count/mean/min/max/slope for the last N days"""
+    start = today - timedelta(days=days)
+    n = sum_x = sum_y = sum_xx = sum_xy = 0.0
+    low = high = None
+    for bucket in buckets:
+        if bucket.day <= start:
+            continue
+        x = float((bucket.day - start).days)
+        n += bucket.count
+        sum_x += bucket.count * x
+        sum_y += bucket.total
+        sum_xx += bucket.count * x * x
+        sum_xy += x * bucket.total
+        low = bucket.min_value if low is None else min(low, bucket.min_value)
+        high = bucket.max_value if high is None else max(high, bucket.max_value)
+    if not n:
+        return None
+    slope = regression_slope(n, sum_x, sum_y, sum_xx, sum_xy)
+    return {
+        'count': int(n),
+        'mean': round(sum_y / n, 2),
+        'min': low,
+        'max': high,
+        'slope_per_day': round(slope, 4),
+        'trend': trend_direction(slope),
+    }
+
+def health_risk(latest):
+    """Risk level from the latest readings, scored like MedicalDataAnalyzer.predictHealthRisk (missing readings score 0)"""
+    score = 0
+    heart_rate = latest.get('heart_rate')
+    # The JS tests 60-100 first, so its <50/>120 branch never adds more than 2
+    if heart_rate is not None and (heart_rate < 60 or heart_rate > 100):
+        score += 2
+    if (latest.get('blood_pressure_systolic') or 0) > 140 or (latest.get('blood_pressure_diastolic') or 0) > 90:
+        score += 2
+    bmi = latest.get('bmi')
+    if bmi is not None:
+        if bmi < 16 or bmi > 30:
+            score += 3
+        elif bmi < 18.5 or bmi > 25:
+            score += 1
+    if score >= 4:
+        return 'High'
+    if score >= 2:
+        return 'Medium'
+    return 'Low'
+
+def rebuild_vitals_stats(patient_id=None):
+    """Recompute running statistics from stored readings (backfill / repair)"""
+    if patient_id is None:
+        patient_ids = db.session.query(Vitals.patient_id).union(db.session.query(VitalsArchive.patient_id))
+        return sum(rebuild_vitals_stats(pid) for (pid,) in patient_ids.all())
+    
+    VitalsStats.query.filter_by(patient_id=patient_id).delete(synchronize_session=False)
+    VitalsDailyStats.query.filter_by(patient_id=patient_id).delete(synchronize_session=False)
+    
+    rebuilt = 0
+    cache = {}
+    with db.session.no_autoflush:
+        for model in (VitalsArchive, Vitals):
+            query = db.session.query(model.patient_id, model.date, *[getattr(model, c) for c in TRACKED_VITALS])
+            for reading in query.filter(model.patient_id == patient_id).order_by(model.date).yield_per(1000):
+                update_vitals_stats(reading, cache)
+                rebuilt += 1
+    db.session.commit()
+    db.session.expunge_all()
+    return rebuilt
+
+@app.cli.command('rebuild-vitals-stats')
+@click.option('--patient-id', type=int, default=None)
+def rebuild_vitals_stats_command(patient_id):
+    """Recompute per-patient vitals statistics from raw readings"""
+    ensure_schema()
+    print(f"📈 Rebuilt statistics from {rebuild_vitals_stats(patient_id)} readings")
+
+@app.route('/api/patient/vitals/trends')
+@patient_login_required
+@conditional_response
+def vitals_trends_api():
+    patient_id = session.get('patient_id')
+    today = datetime.now().date()
+    
+    stats = {s.vital: s for s in VitalsStats.query.filter_by(patient_id=patient_id)}
+    buckets = {}
+    for bucket in VitalsDailyStats.query.filter(
+        VitalsDailyStats.patient_id == patient_id,
+        VitalsDailyStats.day > today - timedelta(days=max(TREND_WINDOWS))
+    ):
+        buckets.setdefault(bucket.vital, []).append(bucket)
+    
+    vitals = {}
+    latest = {}
+    for column, (name, normal_range) in TRACKED_VITALS.items():
+        s = stats.get(column)
+        if s is None:
+            continue
+        latest[column] = s.last_value
+        slope = regression_slope(s.count, s.sum_x, s.sum_y, s.sum_xx, s.sum_xy)
+        vitals[name] = {
+            'count': s.count,
+            'mean': round(s.mean, 2),
+            'stddev': round((s.m2 / (s.count - 1)) ** 0.5, 2) if s.count > 1 else 0.0,
+            'min': s.min_value,
+            'max': s.max_value,
+            'latest': s.last_value,
+            'latest_at': s.last_at.isoformat(),
+            'slope_per_day': round(slope, 4),
+            'trend': trend_direction(slope),
+            'out_of_range': bool(normal_range) and not normal_range[0] <= s.last_value <= normal_range[1],
+            'windows': {str(days): window_summary(buckets.get(column, []), today, days) for days in TREND_WINDOWS},
+        }
+    
+    return jsonify({'risk': health_risk(latest) if latest else 'Unknown', 'vitals': vitals})
+
 # ==================== PDF GENERATION ====================
 
 @app.route('/patient/download-medical-summary')
 @patient_login_required
+@admission_class('pdf')
+@timed_pdf('medical_summary')
 def download_medical_summary():
     try:
         patient_id = session.get('patient_id')
@@ -836,6 +2613,8 @@ def download_medical_summary():
 
 @app.route('/patient/download-prescription/<int:prescription_id>')
 @patient_login_required
+@admission_class('pdf')
+@timed_pdf('prescription')
 def download_prescription(prescription_id):
     try:
         patient_id = session.get('patient_id')
@@ -898,8 +2677,722 @@ def download_prescription(prescription_id):
         flash(f'Error generating PDF: {str(e)}', 'error')
         return redirect(url_for('prescriptions'))
 
+# ==================== FULL HISTORY EXPORT ====================
+
+FHIR_APPOINTMENT_STATUS = {'scheduled': 'booked', 'completed': 'fulfilled', 'cancelled': 'cancelled',
+                           'no-show': 'noshow'}
+
+def export_default(value):
+    """JSON serializer for dates in exported rows"""
+    if isinstance(value, (datetime, date_type)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def row_to_dict(obj, exclude=()):
+    """Plain dict of a model row's columns"""
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns if c.name not in exclude}
+
+def fhir_patient(patient):
+    return {
+        'resourceType': 'Patient',
+        'id': str(patient.id),
+        'name': [{'text': patient.name}],
+        'gender': (patient.gender or '').lower() or None,
+        'telecom': [{'system': 'phone', 'value': patient.contact}, {'system': 'email', 'value': patient.email}],
+        'address': [{'text': patient.address}] if patient.address else [],
+        'extension': [{'url': 'blood-group', 'valueString': patient.blood_group}] if patient.blood_group else [],
+    }
+
+def fhir_appointment(appointment):
+    return {
+        'resourceType': 'Appointment',
+        'id': str(appointment.id),
+        'status': FHIR_APPOINTMENT_STATUS.get(appointment.status, appointment.status),
+        'start': f"{appointment.date.isoformat()} {appointment.time}",
+        'priority': appointment.priority,
+        'description': appointment.symptoms,
+        'comment': appointment.notes,
+        'participant': [{'actor': {'reference': f"Patient/{appointment.patient_id}"}},
+                        {'actor': {'reference': f"Practitioner/{appointment.doctor_id}"}}],
+    }
+
+def fhir_encounter(record):
+    return {
+        'resourceType': 'Encounter',
+        'id': str(record.id),
+        'status': 'finished',
+        'subject': {'reference': f"Patient/{record.patient_id}"},
+        'participant': [{'individual': {'reference': f"Practitioner/{record.doctor_id}"}}],
+        'period': {'start': record.visit_date},
+        'reasonCode': [{'text': record.diagnosis}],
+        'extension': [{'url': name, 'valueString': getattr(record, name)}
+                      for name in ('treatment', 'prescription', 'vitals', 'notes', 'follow_up_date')
+                      if getattr(record, name)],
+    }
+
+def fhir_observation(vitals):
+    components = [(name, getattr(vitals, name)) for name in
+                  ('heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'temperature',
+                   'oxygen_saturation', 'weight', 'height', 'bmi')]
+    return {
+        'resourceType': 'Observation',
+        'id': str(vitals.id),
+        'status': 'final',
+        'category': [{'text': 'vital-signs'}],
+        'subject': {'reference': f"Patient/{vitals.patient_id}"},
+        'effectiveDateTime': vitals.date,
+        'component': [{'code': {'text': name}, 'valueQuantity': {'value': value}}
+                      for name, value in components if value is not None],
+        'note': [{'text': vitals.notes}] if vitals.notes else [],
+    }
+
+def fhir_medication_request(prescription):
+    return {
+        'resourceType': 'MedicationRequest',
+        'id': str(prescription.id),
+        'status': 'active' if prescription.active else 'completed',
+        'subject': {'reference': f"Patient/{prescription.patient_id}"},
+        'requester': {'reference': f"Practitioner/{prescription.doctor_id}"},
+        'authoredOn': prescription.date,
+        'medicationCodeableConcept': {'text': prescription.medication},
+        'dosageInstruction': [{'text': f"{prescription.dosage}, {prescription.frequency} for {prescription.duration}",
+                               'patientInstruction': prescription.instructions}],
+        'dispenseRequest': {'numberOfRepeatsAllowed': prescription.refills},
+    }
+
+def export_sources(patient_id):
+    """(resource type, FHIR mapper, query, sort column, shard) for every table in a patient's history"""
+    return [
+        ('appointment', fhir_appointment,
+         AppointmentArchive.query.filter_by(patient_id=patient_id), AppointmentArchive.date, 0),
+    ] + [
+        ('appointment', fhir_appointment,
+         Appointment.query.filter_by(patient_id=patient_id), Appointment.date, number)
+        for number in shard_router.patient_shards(patient_id)
+    ] + [
+        ('medical_record', fhir_encounter,
+         MedicalRecord.query.filter_by(patient_id=patient_id), MedicalRecord.visit_date, 0),
+        ('vitals', fhir_observation,
+         VitalsArchive.query.filter_by(patient_id=patient_id), VitalsArchive.date, 0),
+        ('vitals', fhir_observation,
+         Vitals.query.filter_by(patient_id=patient_id), Vitals.date, 0),
+        ('prescription', fhir_medication_request,
+         Prescription.query.filter_by(patient_id=patient_id), Prescription.date, 0),
+    ]
+
+def iter_rows(query, sort_column, shard=0):
+    """Iterate a query in (sort_column, id) keyset chunks, expunging rows so memory stays constant"""
+    # Each chunk is fetched in full, so no read cursor (and SQLite SHARED lock) stays open
+    # while the client downloads; an open cursor would make concurrent writers fail with "database is locked"
+    id_column = sort_column.class_.id
+    last = None
+    while True:
+        chunk = query if last is None else query.filter(db.tuple_(sort_column, id_column) > last)
+        with shard_router.use(shard):
+            rows = chunk.order_by(sort_column, id_column).limit(app.config['EXPORT_CHUNK_SIZE']).all()
+        if not rows:
+            return
+        last = (getattr(rows[-1], sort_column.key), rows[-1].id)
+        for obj in rows:
+            yield obj
+            db.session.expunge(obj)
+
+def iter_patient_history(patient_id, fmt):
+    """Yield a patient's full history as NDJSON lines or chunks of a FHIR-style bundle"""
+    patient = db.session.get(Patient, patient_id)
+    
+    if fmt == 'fhir':
+        yield '{"resourceType": "Bundle", "type": "collection", "timestamp": %s, "entry": [\n' % json.dumps(
+            datetime.utcnow().isoformat())
+        yield json.dumps({'resource': fhir_patient(patient)}, default=export_default)
+        for _, mapper, query, sort_column, shard in export_sources(patient_id):
+            for obj in iter_rows(query, sort_column, shard):
+                yield ',\n' + json.dumps({'resource': mapper(obj)}, default=export_default)
+        yield '\n]}\n'
+    else:
+        yield json.dumps({'type': 'patient', **row_to_dict(patient, exclude=('password',))},
+                         default=export_default) + '\n'
+        for resource_type, _, query, sort_column, shard in export_sources(patient_id):
+            for obj in iter_rows(query, sort_column, shard):
+                yield json.dumps({'type': resource_type, **row_to_dict(obj)}, default=export_default) + '\n'
+
+@app.route('/patient/export')
+@patient_login_required
+@admission_class('pdf')  # full-history exports are as heavy as PDFs
+def export_patient_history():
+    patient_id = session.get('patient_id')
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'fhir'):
+        abort(400)
+    
+    mimetype = 'application/fhir+json' if fmt == 'fhir' else 'application/x-ndjson'
+    extension = 'json' if fmt == 'fhir' else 'ndjson'
+    response = app.response_class(stream_with_context(iter_patient_history(patient_id, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=medical_history_{patient_id}.{extension}'
+    return response
+
+# ==================== PRESCRIPTION EXPIRY ====================
+
+@event.listens_for(Prescription, 'before_insert')
+def set_prescription_end_date(mapper, connection, target):
+    """Derive course length and end date from the duration text"""
+    if target.end_date is None:
+        target.course_days = parse_duration_days(target.duration)
+        if target.course_days:
+            start = (target.date or datetime.utcnow()).date()
+            target.end_date = start + timedelta(days=target.course_days)
+
+def _update_prescription_batches(condition, values, batch_size):
+    """Apply an UPDATE to matching prescriptions in batched transactions"""
+    updated = 0
+    while True:
+        rows = db.session.query(Prescription.id, Prescription.patient_id).filter(condition).limit(batch_size).all()
+        if not rows:
+            return updated
+        db.session.execute(
+            Prescription.__table__.update().where(Prescription.id.in_([row[0] for row in rows])).values(values)
+        )
+        bump_data_versions(row[1] for row in rows)
+        db.session.commit()
+        updated += len(rows)
+
+def backfill_prescription_end_dates(batch_size=None):
+    """Fill course_days/end_date for active prescriptions created without them"""
+    batch_size = batch_size or app.config['PRESCRIPTION_BATCH_SIZE']
+    stmt = Prescription.__table__.update().where(
+        Prescription.__table__.c.id == db.bindparam('prescription_id')
+    ).values(course_days=db.bindparam('course_days'), end_date=db.bindparam('end_date'))
+    
+    last_id = 0
+    filled = 0
+    while True:
+        rows = db.session.query(Prescription.id, Prescription.date, Prescription.duration).filter(
+            Prescription.active == True,
+            Prescription.end_date.is_(None),
+            Prescription.id > last_id
+        ).order_by(Prescription.id).limit(batch_size).all()
+        if not rows:
+            return filled
+        last_id = rows[-1][0]
+        params = []
+        for prescription_id, date, duration in rows:
+            course_days = parse_duration_days(duration)
+            if course_days:
+                params.append({'prescription_id': prescription_id, 'course_days': course_days,
+                               'end_date': date.date() + timedelta(days=course_days)})
+        if params:
+            db.session.execute(stmt, params)
+            db.session.commit()
+            filled += len(params)
+
+def expire_prescriptions(today=None, batch_size=None):
+    """Renew prescriptions with refills left and deactivate the rest once their end date passes"""
+    today = today or datetime.now().date()
+    batch_size = batch_size or app.config['PRESCRIPTION_BATCH_SIZE']
+    refills_used = db.func.coalesce(Prescription.refills_used, 0)
+    due = db.and_(Prescription.active == True, Prescription.end_date < today)
+    backfilled = backfill_prescription_end_dates(batch_size)
+    
+    # A refill starts a new course; loop until every renewed course ends in the future
+    renewed = _update_prescription_batches(
+        db.and_(due, refills_used < db.func.coalesce(Prescription.refills, 0), Prescription.course_days > 0),
+        {'end_date': db.func.date(Prescription.end_date, '+' + db.cast(Prescription.course_days, db.String) + ' days'),
+         'refills_used': refills_used + 1},
+        batch_size
+    )
+    expired = _update_prescription_batches(due, {'active': False}, batch_size)
+    return {'backfilled': backfilled, 'renewed': renewed, 'expired': expired}
+
+@app.cli.command('expire-prescriptions')
+def expire_prescriptions_command():
+    """Deactivate prescriptions whose course (and refills) has ended"""
+    ensure_schema()
+    result = expire_prescriptions()
+    print(f"💊 Filled end dates for {result['backfilled']}, renewed {result['renewed']} "
+          f"and expired {result['expired']} prescriptions")
+
+# ==================== APPOINTMENT REMINDERS & NO-SHOW SWEEP ====================
+
+def appointment_start(date, time_text):
+    """Combine an appointment date and its '09:30 AM' / '09:30' time string"""
+    for fmt in ('%I:%M %p', '%H:%M'):
+        try:
+            return datetime.combine(date, datetime.strptime(time_text.strip(), fmt).time())
+        except (AttributeError, ValueError):
+            continue
+    return datetime.combine(date, datetime.min.time()) + timedelta(hours=12)
+
+class LogReminderSink:
+    """Reminder sink that writes to the application log"""
+    def deliver(self, reminder):
+        if reminder.get('type') == 'waitlist_offer':
+            app.logger.info("Waitlist offer: %s can take a slot with %s at %s until %s", reminder['patient_contact'],
+                            reminder['doctor'], reminder['start'], reminder['expires_at'])
+            return
+        app.logger.info("Reminder: %s has an appointment with %s at %s",
+                        reminder['patient_contact'], reminder['doctor'], reminder['start'])
+
+class FileReminderSink:
+    """Reminder sink that appends NDJSON lines for a local gateway to pick up"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+    
+    def deliver(self, reminder):
+        with self.lock, open(self.path, 'a') as f:
+            f.write(json.dumps(reminder) + '\n')
+
+class AppointmentScheduler:
+    """Heap of reminder / sweep events loaded from an indexed date-range query"""
+    REMIND = 'remind'
+    SWEEP = 'sweep'
+    
+    def __init__(self, sink):
+        self.sink = sink
+        self.heap = []
+        self.loaded_through = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+    
+    def schedule(self, appointment_id, date, time_text, remind=True, now=None):
+        """Queue events for one appointment if it falls inside the loaded window"""
+        now = now or datetime.now()
+        if self.loaded_through is None or date > self.loaded_through:
+            return  # picked up when the window reaches this date
+        start = appointment_start(date, time_text)
+        with self.lock:
+            if remind and start > now:
+                heapq.heappush(self.heap, (start - timedelta(minutes=app.config['REMINDER_LEAD_MINUTES']),
+                                           self.REMIND, appointment_id))
+            heapq.heappush(self.heap, (start + timedelta(minutes=app.config['NO_SHOW_GRACE_MINUTES']),
+                                       self.SWEEP, appointment_id))
+    
+    def _load(self, condition, now):
+        """Push events for scheduled appointments matching an indexed date condition, on every shard"""
+        loaded = 0
+        for number in shard_router.shard_numbers():
+            with shard_router.use(number):
+                query = db.session.query(Appointment.id, Appointment.date, Appointment.time,
+                                         Appointment.reminder_sent_at).filter(
+                    Appointment.status == 'scheduled', condition
+                ).order_by(Appointment.date)
+                for appointment_id, date, time_text, reminder_sent_at in query.yield_per(1000):
+                    self.schedule(appointment_id, date, time_text, remind=reminder_sent_at is None, now=now)
+                    loaded += 1
+        return loaded
+    
+    def extend_window(self, now):
+        """Load the next days of appointments once time moves past the loaded window"""
+        today = now.date()
+        horizon = today + timedelta(days=app.config['SCHEDULER_LOOKAHEAD_DAYS'])
+        if self.loaded_at is not None and now - self.loaded_at >= timedelta(seconds=app.config['SCHEDULER_RELOAD_SECONDS']):
+            # Bookings made in another process (web workers vs `flask run-jobs`) never reach
+            # schedule() here, so rebuild the window; duplicate events are no-ops downstream
+            with self.lock:
+                self.heap = []
+            self.loaded_through = None
+        if self.loaded_through is not None and self.loaded_through >= horizon:
+            return 0
+        if self.loaded_through is None:
+            # First run: past appointments still 'scheduled' are swept straight away
+            self.loaded_through = horizon
+            self.loaded_at = now
+            return self._load(Appointment.date <= horizon, now)
+        start = self.loaded_through
+        self.loaded_through = horizon
+        return self._load(db.and_(Appointment.date > start, Appointment.date <= horizon), now)
+    
+    def pop_due(self, now):
+        """Remove and return due (kind, appointment_id) events"""
+        due = {self.REMIND: [], self.SWEEP: []}
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, kind, appointment_id = heapq.heappop(self.heap)
+                due[kind].append(appointment_id)
+        return due
+    
+    def send_reminders(self, appointment_ids, now):
+        """Claim unsent reminders with UPDATE ... RETURNING and hand them to the sink"""
+        sent = 0
+        batch_size = app.config['SCHEDULER_BATCH_SIZE']
+        for number, shard_ids in shard_router.group_ids(appointment_ids).items():
+            for start in range(0, len(shard_ids), batch_size):
+                with shard_router.use(number):
+                    sent += self._send_batch(shard_ids[start:start + batch_size], now)
+        return sent
+    
+    def _send_batch(self, batch, now):
+        claimed = db.session.execute(
+            Appointment.__table__.update().where(
+                Appointment.id.in_(batch),
+                Appointment.status == 'scheduled',
+                Appointment.reminder_sent_at.is_(None)
+            ).values(reminder_sent_at=now).returning(Appointment.id)
+        ).scalars().all()
+        db.session.commit()
+        if not claimed:
+            return 0
+        # Patients and doctors live in clinic.db, so look them up rather than join across shards
+        rows = db.session.query(Appointment.id, Appointment.date, Appointment.time,
+                                Appointment.patient_id, Appointment.doctor_id).filter(Appointment.id.in_(claimed)).all()
+        patients = {row.id: row for row in db.session.query(Patient.id, Patient.name, Patient.contact, Patient.email).filter(
+            Patient.id.in_({row.patient_id for row in rows}))}
+        doctors = dict(db.session.query(Doctor.id, Doctor.name).filter(Doctor.id.in_({row.doctor_id for row in rows})))
+        for appointment_id, date, time_text, patient_id, doctor_id in rows:
+            patient = patients[patient_id]
+            self.sink.deliver({
+                'type': 'reminder',
+                'appointment_id': appointment_id,
+                'patient': patient.name,
+                'patient_contact': patient.contact,
+                'patient_email': patient.email,
+                'doctor': doctors.get(doctor_id),
+                'start': f"{date.isoformat()} {time_text}",
+            })
+        return len(rows)
+    
+    def sweep(self, appointment_ids):
+        """Mark past appointments completed (a visit was recorded) or no-show, in batches"""
+        swept = 0
+        batch_size = app.config['SCHEDULER_BATCH_SIZE']
+        for number, shard_ids in shard_router.group_ids(appointment_ids).items():
+            for start in range(0, len(shard_ids), batch_size):
+                with shard_router.use(number):
+                    swept += self._sweep_batch(shard_ids[start:start + batch_size])
+        return swept
+    
+    def _sweep_batch(self, batch):
+        table = Appointment.__table__
+        pending = db.session.query(table.c.id, table.c.patient_id, table.c.doctor_id, table.c.date).filter(
+            table.c.id.in_(batch), table.c.status == 'scheduled'
+        ).all()
+        if not pending:
+            return 0
+        # Medical records are in clinic.db, so match visits here instead of in a correlated subquery
+        visits = set(db.session.query(MedicalRecord.patient_id, MedicalRecord.doctor_id,
+                                      db.func.date(MedicalRecord.visit_date)).filter(
+            MedicalRecord.patient_id.in_({row.patient_id for row in pending}),
+            MedicalRecord.doctor_id.in_({row.doctor_id for row in pending})
+        ))
+        completed = [row.id for row in pending if (row.patient_id, row.doctor_id, row.date.isoformat()) in visits]
+        still_scheduled = db.and_(table.c.id.in_([row.id for row in pending]), table.c.status == 'scheduled')
+        patient_ids = db.session.execute(
+            table.update().where(still_scheduled, table.c.id.in_(completed)).values(status='completed')
+            .returning(table.c.patient_id)
+        ).scalars().all()
+        patient_ids += db.session.execute(
+            table.update().where(still_scheduled).values(status='no-show').returning(table.c.patient_id)
+        ).scalars().all()
+        bump_data_versions(patient_ids)
+        db.session.commit()
+        return len(patient_ids)
+    
+    def tick(self, now=None):
+        """Do the work that is due: O(due events), no full-table scans"""
+        now = now or datetime.now()
+        self.extend_window(now)
+        due = self.pop_due(now)
+        return {
+            'reminded': self.send_reminders(due[self.REMIND], now),
+            'swept': self.sweep(due[self.SWEEP]),
+        }
+
+appointment_scheduler = AppointmentScheduler(
+    FileReminderSink(app.config['REMINDER_SINK_PATH']) if app.config['REMINDER_SINK_PATH'] else LogReminderSink()
+)
+
+# ==================== BACKGROUND JOBS ====================
+
+class PeriodicJob(threading.Thread):
+    """Daemon thread that runs a function inside the app context at a fixed interval"""
+    def __init__(self, name, interval, func):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.func = func
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.is_set():
+            with app.app_context():
+                try:
+                    self.func()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Background job %s failed", self.name)
+                finally:
+                    db.session.remove()
+            self.stopped.wait(self.interval)
+    
+    def stop(self):
+        self.stopped.set()
+
+background_jobs = []
+background_jobs_lock = threading.Lock()
+
+def background_job_specs():
+    """(name, interval, func) for every periodic job"""
+    return [
+        ('prescription-expiry', app.config['PRESCRIPTION_EXPIRY_INTERVAL'], expire_prescriptions),
+        ('appointment-scheduler', app.config['SCHEDULER_TICK_SECONDS'], appointment_scheduler.tick),
+        ('waitlist-offers', app.config['WAITLIST_SWEEP_SECONDS'], expire_waitlist_offers),
+    ]
+
+def start_background_jobs():
+    """Start the in-process schedulers (once per process)"""
+    with background_jobs_lock:
+        if background_jobs:
+            return
+        for name, interval, func in background_job_specs():
+            background_jobs.append(PeriodicJob(name, interval, func))
+        for job in background_jobs:
+            job.start()
+
+def stop_background_jobs():
+    """Signal the schedulers to stop and wait for the current run to finish"""
+    for job in background_jobs:
+        job.stop()
+    for job in background_jobs:
+        job.join()
+
+@app.before_request
+def start_jobs_in_process():
+    """With CLINIC_RUN_JOBS=1 the first request in each serving process starts the schedulers"""
+    if app.config['BACKGROUND_JOBS_IN_PROCESS'] and not background_jobs:
+        start_background_jobs()
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Run every job a single time and exit (for cron).')
+def run_jobs_command(once):
+    """Run the background jobs in the foreground, next to any WSGI server"""
+    ensure_schema()
+    if once:
+        for name, _, func in background_job_specs():
+            func()
+            db.session.commit()
+            print(f"✅ {name} done")
+        return
+    start_background_jobs()
+    print(f"⏱️ Running {', '.join(job.name for job in background_jobs)} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_background_jobs()
+        print("Background jobs stopped")
+
+# ==================== AUDIT LOG ====================
+
+AUDIT_EVENTS = Counter('clinic_audit_events_total', 'Audit events by outcome (queued, dropped, written)')
+METRICS.append(AUDIT_EVENTS)
+AUDIT_SKIPPED_ENDPOINTS = {'static', 'patient_media', 'patient_media_thumbnail', 'metrics'}
+AUDIT_ACTIONS = {'GET': 'view', 'HEAD': 'view', 'DELETE': 'delete'}
+
+class AuditWriter:
+    """Bounded queue of audit events flushed in batches by a background thread"""
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=app.config['AUDIT_QUEUE_SIZE'])
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+    
+    def submit(self, event):
+        """Enqueue an event without blocking the request longer than the policy allows"""
+        self._ensure_started()
+        try:
+            if app.config['AUDIT_OVERFLOW_POLICY'] == 'block':
+                self.queue.put(event, timeout=app.config['AUDIT_BLOCK_SECONDS'])
+            else:
+                self.queue.put_nowait(event)
+            AUDIT_EVENTS.inc(outcome='queued')
+        except queue.Full:
+            AUDIT_EVENTS.inc(outcome='dropped')
+    
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self.thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=app.config['AUDIT_FLUSH_SECONDS'])
+            except queue.Empty:
+                continue
+            self.flush([first])
+    
+    def flush(self, batch=None):
+        """Write queued events (plus an already dequeued batch) in one transaction"""
+        batch = list(batch or [])
+        while len(batch) < app.config['AUDIT_BATCH_SIZE']:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return 0
+        with self.flush_lock, app.app_context():
+            try:
+                if app.config['AUDIT_LOG_PATH']:
+                    self._append_to_file(batch)
+                else:
+                    with db.engine.begin() as conn:
+                        conn.execute(AuditEvent.__table__.insert(), batch)
+                AUDIT_EVENTS.inc(len(batch), outcome='written')
+            except Exception:
+                AUDIT_EVENTS.inc(len(batch), outcome='dropped')
+                app.logger.exception("Failed to write %d audit events", len(batch))
+        return len(batch)
+    
+    def _append_to_file(self, batch):
+        """Append NDJSON lines, rotating the file once it exceeds AUDIT_LOG_MAX_BYTES"""
+        path = app.config['AUDIT_LOG_PATH']
+        if os.path.exists(path) and os.path.getsize(path) >= app.config['AUDIT_LOG_MAX_BYTES']:
+            os.replace(path, f"{path}.{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}")
+        with open(path, 'a') as f:
+            for event in batch:
+                f.write(json.dumps(event, default=export_default) + '\n')
+    
+    def drain(self):
+        """Flush everything still queued (used at shutdown)"""
+        while self.flush():
+            pass
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.drain)
+
+def current_actor():
+    """(actor_type, actor_id) of the logged-in user"""
+    user_type = session.get('user_type')
+    if user_type in ('patient', 'doctor', 'admin'):
+        return user_type, session.get(f'{user_type}_id')
+    return 'anonymous', None
+
+@app.after_request
+def audit_request(response):
+    """Capture who touched which patient's data on every request"""
+    if request.endpoint in AUDIT_SKIPPED_ENDPOINTS:
+        return response
+    actor_type, actor_id = current_actor()
+    patient_id = (request.view_args or {}).get('patient_id')
+    if patient_id is None and actor_type == 'patient':
+        patient_id = actor_id
+    audit_writer.submit({
+        'created_at': datetime.utcnow(),
+        'actor_type': actor_type,
+        'actor_id': actor_id,
+        'route': request.endpoint or 'unmatched',
+        'method': request.method,
+        'path': request.full_path.rstrip('?')[:500],
+        'patient_id': patient_id,
+        'action': AUDIT_ACTIONS.get(request.method, 'change'),
+        'status_code': response.status_code,
+        'ip_address': request.remote_addr,
+    })
+    return response
+
+@app.route('/api/admin/audit')
+@admin_login_required
+def audit_log_api():
+    query = AuditEvent.query
+    if request.args.get('patient_id', type=int) is not None:
+        query = query.filter(AuditEvent.patient_id == request.args.get('patient_id', type=int))
+    if request.args.get('actor_type'):
+        query = query.filter(AuditEvent.actor_type == request.args['actor_type'])
+    if request.args.get('actor_id', type=int) is not None:
+        query = query.filter(AuditEvent.actor_id == request.args.get('actor_id', type=int))
+    if request.args.get('action'):
+        query = query.filter(AuditEvent.action == request.args['action'])
+    for param in ('since', 'until'):
+        if request.args.get(param):
+            try:
+                bound = datetime.fromisoformat(request.args[param])
+            except ValueError:
+                return jsonify({'error': f"{param} must be an ISO 8601 date or datetime"}), 400
+            query = query.filter(AuditEvent.created_at >= bound if param == 'since' else AuditEvent.created_at < bound)
+    # Keyset pagination: pass the last id of the previous page as before_id
+    if request.args.get('before_id', type=int):
+        query = query.filter(AuditEvent.id < request.args.get('before_id', type=int))
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    
+    events = query.order_by(AuditEvent.id.desc()).limit(limit).all()
+    return jsonify([{
+        'id': e.id,
+        'created_at': e.created_at.isoformat(),
+        'actor_type': e.actor_type,
+        'actor_id': e.actor_id,
+        'route': e.route,
+        'method': e.method,
+        'path': e.path,
+        'patient_id': e.patient_id,
+        'action': e.action,
+        'status_code': e.status_code,
+        'ip_address': e.ip_address
+    } for e in events])
+
 # ==================== DATABASE INITIALIZATION ====================
 
+def add_missing_columns(engine=None, tables=None):
+    """ALTER TABLE ADD COLUMN for nullable columns added to models after the table was created"""
+    engine = engine or db.engine
+    inspector = db.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in tables or db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                    print(f"🛠️ Added column {table.name}.{column.name}")
+
+def ensure_schema():
+    """Create missing tables, columns and any indexes added to existing tables"""
+    db.create_all()
+    add_missing_columns()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    # Opening a shard creates or migrates its tables
+    for number in shard_router.shard_numbers()[1:]:
+        shard_router.engine(number)
+    backfill_patient_shards()
+
+def backfill_record_vitals(batch_size=1000):
+    """Populate typed vitals columns from the JSON string for existing medical records"""
+    typed_missing = db.and_(*[getattr(MedicalRecord, column).is_(None) for column in RECORD_VITAL_COLUMNS])
+    stmt = MedicalRecord.__table__.update().where(
+        MedicalRecord.__table__.c.id == db.bindparam('record_id')
+    ).values({column: db.bindparam(column) for column in RECORD_VITAL_COLUMNS})
+    
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.query(MedicalRecord.id, MedicalRecord.vitals).filter(
+            MedicalRecord.id > last_id,
+            MedicalRecord.vitals.isnot(None),
+            typed_missing
+        ).order_by(MedicalRecord.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        params = [dict(record_id=record_id, **parse_record_vitals(raw)) for record_id, raw in rows]
+        db.session.execute(stmt, params)
+        db.session.commit()
+        updated += len(params)
+    return updated
+
+@app.cli.command('migrate-record-vitals')
+@click.option('--batch-size', default=1000, show_default=True)
+def migrate_record_vitals_command(batch_size):
+    """Add typed vitals columns to medical_record and backfill them"""
+    ensure_schema()
+    print(f"✅ Backfilled vitals for {backfill_record_vitals(batch_size)} medical records")
+
 def init_sample_data():
     """Initialize sample data for testing"""
     with app.app_context():
@@ -995,11 +3488,598 @@ def init_sample_data():
             db.session.commit()
             print("✅ Sample doctors created")
 
+# ==================== BULK IMPORT ====================
+
+IMPORT_SCHEMAS = {
+    'patient': {
+        'model': Patient,
+        'required': ('name', 'age', 'gender', 'cnic', 'email', 'password', 'contact'),
+        'optional': ('address', 'blood_group', 'emergency_contact'),
+        'unique': ('cnic', 'email'),
+        'integers': ('age',),
+        'floats': (),
+        'secret': ('password',),
+    },
+    'doctor': {
+        'model': Doctor,
+        'required': ('name', 'age', 'gender', 'cnic', 'email', 'password', 'contact', 'specialization',
+                     'qualification', 'experience_years', 'license_number'),
+        'optional': ('current_hospital', 'availability', 'consultation_fee'),
+        'unique': ('cnic', 'email', 'license_number'),
+        'integers': ('age', 'experience_years'),
+        'floats': ('consultation_fee',),
+        'secret': ('password',),
+    },
+}
+
+def iter_import_rows(path, fmt=None):
+    """Stream rows from a CSV or NDJSON file as (row number, dict)"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row_number, row in enumerate(csv.DictReader(f), start=1):
+                yield row_number, row
+        else:
+            for row_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield row_number, row if isinstance(row, dict) else {'_invalid': line.strip()}
+
+def validate_import_row(schema, raw):
+    """Normalize one import row, returning (row, None) or (None, reason)"""
+    if '_invalid' in raw:
+        return None, 'unparseable line'
+    row = {}
+    for field in schema['required'] + schema['optional']:
+        value = raw.get(field)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            if field in schema['required']:
+                return None, f"missing {field}"
+            continue
+        row[field] = value
+    if '@' not in row['email']:
+        return None, 'invalid email'
+    try:
+        for field in schema['integers']:
+            row[field] = int(row[field])
+        for field in schema['floats']:
+            if field in row:
+                row[field] = float(row[field])
+    except ValueError as e:
+        return None, f"invalid number: {e}"
+    return row, None
+
+def redact_import_row(schema, raw):
+    """Copy of a raw row with secret fields masked, safe to write to the rejects file"""
+    if '_invalid' in raw:
+        # Unparseable line: mask anything that looks like "secret": "value"
+        line = raw['_invalid']
+        for field in schema['secret']:
+            line = re.sub(rf'("{field}"\s*:\s*)("(?:[^"\\]|\\.)*"|[^,}}\s]+)', r'\1"[redacted]"', line)
+        return {'_invalid': line}
+    return {key: '[redacted]' if key in schema['secret'] and value else value for key, value in raw.items()}
+
+def _import_chunk(schema, chunk, seen, pool):
+    """Validate, dedupe and bulk-insert one chunk; returns (inserted, rejects)"""
+    model = schema['model']
+    rejects = []
+    valid = []
+    for row_number, raw in chunk:
+        row, reason = validate_import_row(schema, raw)
+        if row is None:
+            rejects.append((row_number, reason, raw))
+            continue
+        duplicate = next((f for f in schema['unique'] if row[f] in seen[f]), None)
+        if duplicate:
+            rejects.append((row_number, f"duplicate {duplicate} in file", raw))
+            continue
+        for field in schema['unique']:
+            seen[field].add(row[field])
+        valid.append((row_number, row, raw))
+    
+    # One IN (...) lookup per unique field for the whole chunk
+    taken = {}
+    for field in schema['unique']:
+        column = getattr(model, field)
+        values = [row[field] for _, row, _ in valid]
+        taken[field] = {value for (value,) in db.session.query(column).filter(column.in_(values))} if values else set()
+    
+    rows = []
+    for row_number, row, raw in valid:
+        existing = next((f for f in schema['unique'] if row[f] in taken[f]), None)
+        if existing:
+            rejects.append((row_number, f"{existing} already registered", raw))
+        else:
+            rows.append(row)
+    
+    if rows:
+        hashes = pool.map(generate_password_hash, [row['password'] for row in rows], chunksize=16)
+        for row, hashed in zip(rows, hashes):
+            row['password'] = hashed
+        db.session.execute(model.__table__.insert(), rows)
+        if model is Doctor:
+            bump_data_versions()
+        db.session.commit()
+    return len(rows), rejects
+
+def import_accounts(kind, path, fmt=None, chunk_size=1000, rejects_path=None, checkpoint_path=None, workers=None):
+    """Stream a CSV/NDJSON file of patients or doctors into the database in chunks"""
+    schema = IMPORT_SCHEMAS[kind]
+    rejects_path = rejects_path or f"{path}.rejects.ndjson"
+    checkpoint_path = checkpoint_path or f"{path}.checkpoint.json"
+    
+    checkpoint = {'rows_done': 0, 'imported': 0, 'rejected': 0}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    
+    seen = {field: set() for field in schema['unique']}
+    
+    def flush(chunk, rejects_file):
+        inserted, rejects = _import_chunk(schema, chunk, seen, pool)
+        for row_number, reason, raw in rejects:
+            rejects_file.write(json.dumps({'row': row_number, 'reason': reason,
+                                           'data': redact_import_row(schema, raw)}) + '\n')
+        rejects_file.flush()
+        checkpoint['rows_done'] = chunk[-1][0]
+        checkpoint['imported'] += inserted
+        checkpoint['rejected'] += len(rejects)
+        with open(checkpoint_path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(checkpoint_path + '.tmp', checkpoint_path)
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(rejects_path, 'a') as rejects_file:
+        chunk = []
+        for row_number, raw in iter_import_rows(path, fmt):
+            if row_number <= checkpoint['rows_done']:
+                continue  # already handled by a previous run
+            chunk.append((row_number, raw))
+            if len(chunk) >= chunk_size:
+                flush(chunk, rejects_file)
+                chunk = []
+        if chunk:
+            flush(chunk, rejects_file)
+    
+    return checkpoint
+
+@app.cli.command('import-accounts')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_SCHEMAS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Defaults to the file extension')
+@click.option('--chunk-size', default=1000, show_default=True)
+@click.option('--rejects', 'rejects_path', default=None, help='Defaults to <path>.rejects.ndjson')
+@click.option('--checkpoint', 'checkpoint_path', default=None, help='Defaults to <path>.checkpoint.json')
+@click.option('--workers', type=int, default=None, help='Password hashing processes')
+def import_accounts_command(kind, path, fmt, chunk_size, rejects_path, checkpoint_path, workers):
+    """Bulk import patients or doctors from CSV/NDJSON (resumable)"""
+    ensure_schema()
+    started = time.perf_counter()
+    result = import_accounts(kind, path, fmt, chunk_size, rejects_path, checkpoint_path, workers)
+    print(f"✅ Imported {result['imported']} {kind}s, rejected {result['rejected']} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+# ==================== SYNTHETIC DATA & BENCHMARKS ====================
+
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology',
+                   'General Medicine', 'ENT', 'Gynecology', 'Psychiatry', 'Ophthalmology']
+HOSPITALS = ['City General Hospital', 'Children Hospital', 'Orthopedic Center', 'Skin Care Clinic',
+             'Rural Health Center', 'Civil Hospital']
+TIME_SLOTS = ['09:00 AM', '09:30 AM', '10:00 AM', '10:30 AM', '11:00 AM', '11:30 AM',
+              '02:00 PM', '02:30 PM', '03:00 PM', '03:30 PM', '04:00 PM', '04:30 PM']
+DIAGNOSES = ['Hypertension', 'Type 2 Diabetes', 'Seasonal Flu', 'Migraine', 'Asthma', 'Gastritis',
+             'Lower Back Pain', 'Allergic Rhinitis', 'Anemia', 'Urinary Tract Infection']
+MEDICATIONS = [('Amlodipine', '5mg'), ('Metformin', '500mg'), ('Paracetamol', '500mg'),
+               ('Amoxicillin', '250mg'), ('Omeprazole', '20mg'), ('Salbutamol', '100mcg'),
+               ('Cetirizine', '10mg'), ('Ibuprofen', '400mg')]
+DURATIONS = ['5 days', '7 days', '10 days', '2 weeks', '1 month', '3 months']
+
+def skewed_weights(n, skew):
+    """Zipf-like cumulative weights so a few rows get most of the activity"""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / (rank ** skew) if skew > 0 else 1.0
+        cumulative.append(total)
+    return cumulative
+
+def bulk_insert(model, rows, batch_size):
+    """Insert rows from any iterable with executemany, one transaction per batch; returns the count"""
+    rows = iter(rows)
+    total = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return total
+        with db.engine.begin() as conn:
+            conn.execute(model.__table__.insert(), batch)
+        total += len(batch)
+
+def generate_synthetic_data(patients=10000, doctors=200, appointments_per_patient=8,
+                            vitals_per_patient=20, records_per_patient=4, prescriptions_per_patient=3,
+                            skew=1.1, years=3, seed=42, batch_size=10000):
+    """Bulk-create a reproducible, skewed production-like dataset, batch_size rows in memory at a time"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    patient_start = (db.session.query(db.func.max(Patient.id)).scalar() or 0) + 1
+    doctor_start = (db.session.query(db.func.max(Doctor.id)).scalar() or 0) + 1
+    patient_ids = range(patient_start, patient_start + patients)
+    doctor_ids = range(doctor_start, doctor_start + doctors)
+    patient_weights = skewed_weights(patients, skew)
+    doctor_weights = skewed_weights(doctors, skew)
+    history_days = years * 365
+    counts = {}
+    
+    def pick(ids, weights, total):
+        for start in range(0, total, batch_size):
+            yield from rng.choices(ids, cum_weights=weights, k=min(batch_size, total - start))
+    
+    def pick_pairs(total):
+        return zip(pick(patient_ids, patient_weights, total), pick(doctor_ids, doctor_weights, total))
+    
+    def past_datetime():
+        return now - timedelta(days=rng.randint(0, history_days), minutes=rng.randint(0, 1440))
+    
+    def doctor_rows():
+        for doctor_id in doctor_ids:
+            yield {
+                'id': doctor_id,
+                'name': f"Dr. Synthetic {doctor_id}",
+                'age': rng.randint(30, 65),
+                'gender': rng.choice(['Male', 'Female']),
+                'cnic': f"SYN-D-{seed}-{doctor_id}",
+                'email': f"doctor{doctor_id}.{seed}@synthetic.clinic",
+                'password': 'doctor123',
+                'contact': f"0300-{rng.randint(1000000, 9999999)}",
+                'specialization': rng.choice(SPECIALIZATIONS),
+                'qualification': 'MBBS, FCPS',
+                'experience_years': rng.randint(2, 35),
+                'license_number': f"SYN-PMC-{seed}-{doctor_id}",
+                'current_hospital': rng.choice(HOSPITALS),
+                'availability': 'Mon-Fri: 9AM-5PM',
+                'consultation_fee': float(rng.randrange(1000, 5000, 100))
+            }
+    
+    def patient_rows():
+        for patient_id in patient_ids:
+            yield {
+                'id': patient_id,
+                'name': f"Synthetic Patient {patient_id}",
+                'age': rng.randint(1, 90),
+                'gender': rng.choice(['Male', 'Female']),
+                'cnic': f"SYN-P-{seed}-{patient_id}",
+                'email': f"patient{patient_id}.{seed}@synthetic.clinic",
+                'password': 'patient123',
+                'contact': f"0301-{rng.randint(1000000, 9999999)}",
+                'blood_group': rng.choice(['A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-']),
+                'created_at': now - timedelta(days=history_days)
+            }
+    
+    def appointment_rows():
+        for patient_id, doctor_id in pick_pairs(patients * appointments_per_patient):
+            date = (now + timedelta(days=rng.randint(-history_days, 60))).date()
+            if date >= now.date():
+                status = 'cancelled' if rng.random() < 0.15 else 'scheduled'
+            else:
+                status = 'cancelled' if rng.random() < 0.15 else 'completed'
+            yield {
+                'patient_id': patient_id,
+                'doctor_id': doctor_id,
+                'date': date,
+                'time': rng.choice(TIME_SLOTS),
+                'status': status,
+                'symptoms': rng.choice(DIAGNOSES),
+                'priority': rng.choices(['normal', 'urgent', 'emergency'], weights=[85, 12, 3])[0],
+                'created_at': now
+            }
+    
+    def vitals_rows():
+        for patient_id in pick(patient_ids, patient_weights, patients * vitals_per_patient):
+            weight = round(rng.uniform(45, 110), 1)
+            height = round(rng.uniform(150, 190), 1)
+            yield {
+                'patient_id': patient_id,
+                'date': past_datetime(),
+                'heart_rate': rng.randint(55, 110),
+                'blood_pressure_systolic': rng.randint(95, 175),
+                'blood_pressure_diastolic': rng.randint(60, 105),
+                'temperature': round(rng.uniform(97.0, 101.5), 1),
+                'oxygen_saturation': rng.randint(90, 100),
+                'weight': weight,
+                'height': height,
+                'bmi': calculate_bmi(weight, height)
+            }
+    
+    def record_rows():
+        for patient_id, doctor_id in pick_pairs(patients * records_per_patient):
+            vitals = json.dumps({
+                'heart_rate': rng.randint(55, 110),
+                'blood_pressure': f"{rng.randint(95, 175)}/{rng.randint(60, 105)}",
+                'temperature': round(rng.uniform(97.0, 101.5), 1),
+                'oxygen_saturation': rng.randint(90, 100),
+                'weight': round(rng.uniform(45, 110), 1)
+            })
+            yield {
+                'patient_id': patient_id,
+                'doctor_id': doctor_id,
+                'visit_date': past_datetime(),
+                'diagnosis': rng.choice(DIAGNOSES),
+                'treatment': 'Medication and follow-up',
+                'vitals': vitals,
+                **parse_record_vitals(vitals)
+            }
+    
+    def prescription_rows():
+        for patient_id, doctor_id in pick_pairs(patients * prescriptions_per_patient):
+            medication, dosage = rng.choice(MEDICATIONS)
+            yield {
+                'patient_id': patient_id,
+                'doctor_id': doctor_id,
+                'date': past_datetime(),
+                'medication': medication,
+                'dosage': dosage,
+                'frequency': rng.choice(['Once daily', 'Twice daily', 'Three times daily']),
+                'duration': rng.choice(DURATIONS),
+                'refills': rng.randint(0, 3),
+                'active': True
+            }
+    
+    counts['doctors'] = bulk_insert(Doctor, doctor_rows(), batch_size)
+    counts['patients'] = bulk_insert(Patient, patient_rows(), batch_size)
+    counts['appointments'] = bulk_insert(Appointment, appointment_rows(), batch_size)
+    counts['vitals'] = bulk_insert(Vitals, vitals_rows(), batch_size)
+    counts['medical_records'] = bulk_insert(MedicalRecord, record_rows(), batch_size)
+    counts['prescriptions'] = bulk_insert(Prescription, prescription_rows(), batch_size)
+    
+    # Bulk inserts bypass update_vitals_stats, so build the trend statistics from the new readings
+    for patient_id in patient_ids:
+        rebuild_vitals_stats(patient_id)
+    
+    bump_data_versions()  # new doctors change shared pages
+    db.session.commit()
+    return counts
+
+@app.cli.command('seed-synthetic')
+@click.option('--patients', default=10000, show_default=True)
+@click.option('--doctors', default=200, show_default=True)
+@click.option('--appointments-per-patient', default=8, show_default=True)
+@click.option('--vitals-per-patient', default=20, show_default=True)
+@click.option('--records-per-patient', default=4, show_default=True)
+@click.option('--prescriptions-per-patient', default=3, show_default=True)
+@click.option('--skew', default=1.1, show_default=True, help='Zipf exponent, 0 for uniform')
+@click.option('--years', default=3, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+@click.option('--batch-size', default=10000, show_default=True)
+def seed_synthetic_command(**options):
+    """Bulk-generate synthetic patients, doctors and clinical history"""
+    ensure_schema()
+    started = time.perf_counter()
+    counts = generate_synthetic_data(**options)
+    for table, count in counts.items():
+        print(f"✅ {table}: {count}")
+    print(f"⏱️ Generated in {time.perf_counter() - started:.1f}s")
+
+def benchmark_requests(patient_id):
+    """(name, method, url, data) tuples covering every page and API for one patient.
+    
+    url and data may be callables taking the iteration number, for writes that need fresh values.
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    specialization = db.session.query(Doctor.specialization).limit(1).scalar() or ''
+    prescription = Prescription.query.filter_by(patient_id=patient_id).first()
+    patient = db.session.get(Patient, patient_id)
+    doctor_id = db.session.query(Doctor.id).order_by(Doctor.id).limit(1).scalar()
+    slot = TIME_SLOTS[0]
+    
+    def booking_date(iteration):
+        # Well past the synthetic data's 60-day horizon so the slot is free
+        return datetime.now().date() + timedelta(days=400 + iteration)
+    
+    def booking_form(iteration):
+        return {'doctor_id': doctor_id, 'date': booking_date(iteration).strftime('%Y-%m-%d'),
+                'time': slot, 'symptoms': 'Benchmark', 'priority': 'normal'}
+    
+    def cancel_url(iteration):
+        with shard_router.use_doctor(doctor_id):
+            appointment_id = db.session.query(Appointment.id).filter_by(
+                patient_id=patient_id, doctor_id=doctor_id, date=booking_date(iteration),
+                time=slot, status='scheduled'
+            ).limit(1).scalar()
+        return f"/patient/appointment/{appointment_id or 0}/cancel"
+    
+    profile_form = {
+        'name': patient.name,
+        'age': patient.age,
+        'gender': patient.gender,
+        'contact': patient.contact,
+        'address': patient.address or '',
+        'blood_group': patient.blood_group or '',
+        'emergency_contact': patient.emergency_contact or '',
+    }
+    vitals_form = {'heart_rate': 72, 'bp_systolic': 120, 'bp_diastolic': 80, 'temperature': 98.6,
+                   'oxygen_saturation': 98, 'weight': 70, 'height': 175, 'notes': 'Benchmark'}
+    
+    plan = [
+        ('home', 'GET', '/', None),
+        ('login_patient', 'POST', '/login/patient', {'email': patient.email, 'password': patient.password}),
+        ('patient_dashboard', 'GET', '/patient/dashboard', None),
+        ('book_appointment', 'GET', '/patient/book-appointment', None),
+        ('view_appointments', 'GET', '/patient/appointments', None),
+        ('medical_records', 'GET', '/patient/medical-records', None),
+        ('patient_vitals', 'GET', '/patient/vitals', None),
+        ('prescriptions', 'GET', '/patient/prescriptions', None),
+        ('patient_profile', 'GET', '/patient/profile', None),
+        ('available_doctors', 'GET', f"/api/doctors/available?date={today}&specialization={specialization}", None),
+        ('vitals_api', 'GET', '/api/patient/vitals?days=30', None),
+        ('vitals_trends_api', 'GET', '/api/patient/vitals/trends', None),
+        ('appointments_api', 'GET', '/api/patient/appointments', None),
+        ('waitlist_api', 'GET', '/api/patient/waitlist', None),
+        ('download_medical_summary', 'GET', '/patient/download-medical-summary', None),
+        ('export_patient_history', 'GET', '/patient/export', None),
+        ('export_patient_history_fhir', 'GET', '/patient/export?format=fhir', None),
+        ('book_appointment_post', 'POST', '/patient/book-appointment', booking_form),
+        ('cancel_appointment', 'POST', cancel_url, None),
+        ('patient_vitals_post', 'POST', '/patient/vitals', vitals_form),
+        ('patient_profile_post', 'POST', '/patient/profile', profile_form),
+        ('admin_appointments_api', 'GET', f"/api/admin/appointments?date={today}", None),
+        ('admin_hospital_stats_api', 'GET', '/api/admin/hospitals/stats', None),
+        ('audit_log_api', 'GET', f"/api/admin/audit?patient_id={patient_id}", None),
+    ]
+    if prescription:
+        plan.append(('download_prescription', 'GET', f"/patient/download-prescription/{prescription.id}", None))
+    return plan
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def unexpected_response(response):
+    """Errors, and redirects to a login page (the route was never really measured)"""
+    return response.status_code >= 400 or '/login' in response.headers.get('Location', '')
+
+def run_benchmark(iterations=20, sample_patients=10, seed=42):
+    """Drive every route through the test client and collect latency and SQL counts"""
+    rng = random.Random(seed)
+    patient_ids = [row[0] for row in db.session.query(Patient.id).all()]
+    if not patient_ids:
+        raise click.ClickException("No patients found, run 'flask seed-synthetic' first")
+    
+    # Always include the busiest patient so the tail is represented (synthetic data is seeded into clinic.db)
+    with shard_router.use(0):
+        busiest = db.session.query(Appointment.patient_id).group_by(Appointment.patient_id).order_by(
+            db.func.count(Appointment.id).desc()
+        ).limit(1).scalar()
+    sample = rng.sample(patient_ids, min(sample_patients, len(patient_ids)))
+    if busiest and busiest not in sample:
+        sample[0] = busiest
+    
+    statement_count = [0]
+    def count_statement(*args):
+        statement_count[0] += 1
+    engines = [shard_router.bind(shard) for shard in shard_router.shard_numbers()]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count_statement)
+    rate_limit_enabled = app.config['RATE_LIMIT_ENABLED']
+    app.config['RATE_LIMIT_ENABLED'] = False  # measure the routes, not the limiter
+    
+    timings = {}
+    sql_counts = {}
+    unexpected = {}
+    # Admin APIs get their own client: the login_patient step starts a fresh session
+    admin_client = app.test_client()
+    with admin_client.session_transaction() as sess:
+        sess['admin'] = 'benchmark'
+    try:
+        for patient_id in sample:
+            plan = benchmark_requests(patient_id)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['patient'] = 'benchmark'
+                sess['patient_id'] = patient_id
+                sess['user_type'] = 'patient'
+            for iteration in range(iterations):
+                for name, method, url, data in plan:
+                    url = url(iteration) if callable(url) else url
+                    data = data(iteration) if callable(data) else data
+                    statement_count[0] = 0
+                    started = time.perf_counter()
+                    # Read the whole body so streamed exports are timed, and close to free the admission slot
+                    response = (admin_client if url.startswith('/api/admin/') else client).open(
+                        url, method=method, data=data)
+                    response.get_data()
+                    response.close()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timings.setdefault(name, []).append(elapsed)
+                    sql_counts.setdefault(name, []).append(statement_count[0])
+                    if unexpected_response(response):
+                        unexpected.setdefault(name, set()).add(response.status_code)
+                # Drop flashed messages so they do not accumulate in the session
+                with client.session_transaction() as sess:
+                    sess.pop('_flashes', None)
+    finally:
+        app.config['RATE_LIMIT_ENABLED'] = rate_limit_enabled
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+    
+    results = {}
+    for name, values in timings.items():
+        values.sort()
+        results[name] = {
+            'requests': len(values),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'sql_avg': round(sum(sql_counts[name]) / len(sql_counts[name]), 1),
+            'sql_max': max(sql_counts[name]),
+            'unexpected_statuses': sorted(unexpected.get(name, ())),
+        }
+    return results
+
+def find_regressions(results, baseline, tolerance):
+    """Routes whose p95 latency or SQL count grew beyond the baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['sql_max'] > previous['sql_max']:
+            regressions.append(f"{name}: SQL statements {previous['sql_max']} -> {current['sql_max']}")
+    return regressions
+
+@app.cli.command('benchmark')
+@click.option('--iterations', default=20, show_default=True, help='Requests per route per patient')
+@click.option('--sample-patients', default=10, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+@click.option('--baseline', 'baseline_path', default=os.path.join(basedir, 'instance', 'benchmark_baseline.json'),
+              show_default=True)
+@click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed p95 slowdown before flagging')
+def benchmark_command(iterations, sample_patients, seed, baseline_path, save_baseline, tolerance):
+    """Report p50/p95/p99 latency and SQL statement counts per route"""
+    results = run_benchmark(iterations, sample_patients, seed)
+    
+    print(f"{'route':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql avg':>10}{'sql max':>10}")
+    for name, r in sorted(results.items()):
+        print(f"{name:<28}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['sql_avg']:>10}{r['sql_max']:>10}")
+    
+    # Timings of error pages or login redirects say nothing about the route, so never keep them
+    failed = {name: r['unexpected_statuses'] for name, r in results.items() if r['unexpected_statuses']}
+    if failed:
+        print("❌ Routes answered with errors or login redirects:")
+        for name, statuses in sorted(failed.items()):
+            print(f"   {name}: {', '.join(map(str, statuses))}")
+        raise SystemExit(1)
+    
+    if save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"💾 Baseline saved to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            regressions = find_regressions(results, json.load(f), tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            raise SystemExit(1)
+        print("✅ No regressions against baseline")
+
 # ==================== RUN APP ====================
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        ensure_schema()
         init_sample_data()
         
         inspector = db.inspect(db.engine)
@@ -1007,4 +4087,9 @@ if __name__ == '__main__':
         print("🏥 Total Doctors:", Doctor.query.count())
         print("👥 Total Patients:", Patient.query.count())
     
+    # The debug reloader imports the app twice; only the serving child runs jobs.
+    # Other servers: `flask run-jobs` in its own process, or CLINIC_RUN_JOBS=1
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and not app.config['BACKGROUND_JOBS_IN_PROCESS']:
+        start_background_jobs()
+    
     app.run(debug=True)
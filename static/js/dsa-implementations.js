@@ -173,6 +173,13 @@ class MedicalDataAnalyzer {
     return trends;
   }
 
+  // Fetch trends computed incrementally on the server (no raw history needed)
+  async loadServerTrends() {
+    const response = await fetch("/api/patient/vitals/trends");
+    if (!response.ok) throw new Error(`Failed to load trends: ${response.status}`);
+    return response.json();
+  }
+
   // Linear regression trend calculation
   calculateLinearTrend(data) {
     const cleanData = data.filter((val) => val !== null && val !== undefined);
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a scratch database before it is imported
+scratch_dir = tempfile.mkdtemp(prefix='clinic-tests-')
+os.environ['CLINIC_DB_PATH'] = os.path.join(scratch_dir, 'clinic.db')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as clinic  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Fresh schema for every test, with shards kept in tmp_path; config changes are undone afterwards"""
+    flask_app = clinic.app
+    saved_config = dict(flask_app.config)
+    flask_app.config.update(TESTING=True, RATE_LIMIT_ENABLED=False, SHARDING_ENABLED=False,
+                            SHARD_FOLDER=str(tmp_path / 'shards'))
+    with flask_app.app_context():
+        clinic.db.drop_all()
+        clinic.ensure_schema()
+        yield flask_app
+        clinic.db.session.remove()
+        clinic.audit_writer.drain()
+    for engine in clinic.shard_router.engines.values():
+        engine.dispose()
+    clinic.shard_router.engines.clear()
+    clinic.shard_router.hospitals.clear()
+    flask_app.config.clear()
+    flask_app.config.update(saved_config)
+
+
+@pytest.fixture
+def make_doctor(app):
+    def make(name='Dr. Test', hospital='City Hospital'):
+        doctor = clinic.Doctor(
+            name=name, age=40, gender='Female', cnic=f'cnic-{name}', email=f'{name}@test.clinic',
+            password='doctor123', contact='0300-0000000', specialization='Cardiology',
+            qualification='MBBS', experience_years=10, license_number=f'lic-{name}',
+            current_hospital=hospital
+        )
+        clinic.db.session.add(doctor)
+        clinic.db.session.commit()
+        return doctor.id
+    return make
+
+
+@pytest.fixture
+def login(app):
+    """Test client logged in as a new patient"""
+    def make(name='patient'):
+        patient = clinic.Patient(name=name, age=30, gender='Male', cnic=f'cnic-{name}',
+                                 email=f'{name}@test.clinic', password='patient123', contact='0301-0000000')
+        clinic.db.session.add(patient)
+        clinic.db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['patient'] = name
+            sess['patient_id'] = patient.id
+            sess['user_type'] = 'patient'
+        client.patient_id = patient.id
+        return client
+    return make
@@ -0,0 +1,52 @@
+import app as clinic
+
+
+def test_clients_past_their_burst_get_429(app, login, monkeypatch):
+    monkeypatch.setattr(clinic, 'rate_limit_backend', clinic.MemoryRateLimitBackend())
+    app.config.update(RATE_LIMIT_ENABLED=True, RATE_LIMIT_BURST=3, RATE_LIMIT_PER_SECOND=0.5)
+    client, other = login('busy'), login('other')
+
+    statuses = [client.get('/api/patient/appointments').status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    response = client.get('/api/patient/appointments')
+    assert response.json == {'error': 'Too many requests, please slow down.'}
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Buckets are per user
+    assert other.get('/api/patient/appointments').status_code == 200
+
+
+def test_saturated_endpoint_class_sheds_with_503(app, login, monkeypatch):
+    limiter = clinic.ConcurrencyLimiter('json', 1)
+    monkeypatch.setitem(clinic.concurrency_limiters, 'json', limiter)
+    app.config['ADMISSION_WAIT_SECONDS'] = 0.01
+    client = login()
+
+    assert limiter.acquire(0)
+    assert client.get('/api/patient/appointments').status_code == 503
+    limiter.release()
+    assert client.get('/api/patient/appointments').status_code == 200
+    assert limiter.acquire(0)  # the request gave its slot back
+    limiter.release()
+
+
+def test_streamed_export_holds_its_slot_until_closed(app, login, monkeypatch):
+    limiter = clinic.ConcurrencyLimiter('pdf', 1)
+    monkeypatch.setitem(clinic.concurrency_limiters, 'pdf', limiter)
+    app.config['ADMISSION_WAIT_SECONDS'] = 0.01
+    client = login()
+
+    response = client.get('/patient/export')
+    assert response.is_streamed
+    assert client.get('/patient/export').status_code == 503
+    response.close()
+    with client.get('/patient/export') as response:
+        assert response.status_code == 200
+
+
+def test_benchmark_leaves_rate_limiting_as_it_found_it(app):
+    clinic.generate_synthetic_data(patients=3, doctors=2, appointments_per_patient=1, vitals_per_patient=1,
+                                   records_per_patient=1, prescriptions_per_patient=1)
+    app.config['RATE_LIMIT_ENABLED'] = True
+    clinic.run_benchmark(iterations=1, sample_patients=1)
+    assert app.config['RATE_LIMIT_ENABLED'] is True
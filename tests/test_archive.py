@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+def history_page(patient_id, number, per_page):
+    hot = clinic.Appointment.query.filter_by(patient_id=patient_id).order_by(clinic.Appointment.date.desc())
+    archive = clinic.AppointmentArchive.query.filter_by(patient_id=patient_id).order_by(
+        clinic.AppointmentArchive.date.desc())
+    items, has_next = clinic.paginate_history(hot, archive, number, per_page)
+    return [item.date for item in items], has_next
+
+
+def test_history_pages_continue_from_hot_rows_into_the_archive(app, make_doctor, login):
+    app.config['HISTORY_PAGE_SIZE'] = 3
+    doctor_id = make_doctor()
+    client = login()
+    old_day = date.today() - timedelta(days=app.config['ARCHIVE_HORIZON_DAYS'] + 30)
+    recent_day = date.today() - timedelta(days=10)
+    for offset in range(4):
+        for day in (old_day, recent_day):
+            clinic.db.session.add(clinic.Appointment(
+                patient_id=client.patient_id, doctor_id=doctor_id, date=day - timedelta(days=offset),
+                time='10:00 AM', status='completed'
+            ))
+    clinic.db.session.commit()
+
+    moved = clinic.archive_old_rows()
+    assert moved['appointments'] == 4
+    assert clinic.AppointmentArchive.query.count() == 4
+
+    expected = [recent_day - timedelta(days=n) for n in range(4)] + [old_day - timedelta(days=n) for n in range(4)]
+    assert history_page(client.patient_id, 1, 3) == (expected[0:3], True)
+    assert history_page(client.patient_id, 2, 3) == (expected[3:6], True)
+    assert history_page(client.patient_id, 3, 3) == (expected[6:8], False)
+
+    page = client.get('/patient/appointments?page=3')
+    assert page.status_code == 200
+    assert expected[6].strftime('%b %d, %Y').encode() in page.data
+
+
+def test_scheduled_appointments_are_never_archived(app, make_doctor, login):
+    doctor_id = make_doctor()
+    client = login()
+    old_day = date.today() - timedelta(days=app.config['ARCHIVE_HORIZON_DAYS'] + 30)
+    clinic.db.session.add(clinic.Appointment(patient_id=client.patient_id, doctor_id=doctor_id, date=old_day,
+                                             time='10:00 AM', status='scheduled'))
+    clinic.db.session.commit()
+    assert clinic.archive_old_rows()['appointments'] == 0
+
+
+def test_vitals_api_reads_the_archive_only_for_long_windows(app, login):
+    client = login()
+    old = datetime.now() - timedelta(days=app.config['ARCHIVE_HORIZON_DAYS'] + 5)
+    clinic.db.session.add_all([
+        clinic.Vitals(patient_id=client.patient_id, date=old, heart_rate=70),
+        clinic.Vitals(patient_id=client.patient_id, date=datetime.now() - timedelta(days=1), heart_rate=80),
+    ])
+    clinic.db.session.commit()
+    assert clinic.archive_old_rows()['vitals'] == 1
+
+    assert client.get('/api/patient/vitals?days=30').json['heart_rate'] == [80]
+    long_window = app.config['ARCHIVE_HORIZON_DAYS'] + 30
+    assert client.get(f'/api/patient/vitals?days={long_window}').json['heart_rate'] == [70, 80]
+
+
+def test_archive_cli_rejects_horizons_shorter_than_the_configured_one(app):
+    horizon = app.config['ARCHIVE_HORIZON_DAYS']
+    result = app.test_cli_runner().invoke(args=['archive-old-data', '--horizon-days', '30'])
+    assert result.exit_code != 0 and '--horizon-days' in result.output
+    result = app.test_cli_runner().invoke(args=['archive-old-data', '--horizon-days', str(horizon + 30)])
+    assert result.exit_code == 0, result.output
+    assert app.config['ARCHIVE_HORIZON_DAYS'] == horizon
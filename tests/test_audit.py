@@ -0,0 +1,35 @@
+import app as clinic
+
+
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = 'admin'
+        sess['user_type'] = 'admin'
+    return client
+
+
+def test_patient_reads_are_audited_and_queryable(app, login):
+    client = login()
+    client.get('/api/patient/appointments')
+    client.get('/api/patient/vitals?days=30')
+    clinic.audit_writer.drain()
+
+    admin = admin_client(app)
+    events = admin.get(f'/api/admin/audit?patient_id={client.patient_id}').json
+    assert [e['route'] for e in events] == ['vitals_api', 'appointments_api']
+    assert {(e['actor_type'], e['actor_id'], e['action']) for e in events} == {('patient', client.patient_id, 'view')}
+
+    assert len(admin.get(f"/api/admin/audit?patient_id={client.patient_id}&before_id={events[0]['id']}").json) == 1
+
+
+def test_audit_api_requires_an_admin(login):
+    assert login().get('/api/admin/audit').status_code == 302
+
+
+def test_malformed_time_bounds_are_rejected_with_400(app):
+    admin = admin_client(app)
+    response = admin.get('/api/admin/audit?since=yesterday')
+    assert response.status_code == 400
+    assert response.json == {'error': 'since must be an ISO 8601 date or datetime'}
+    assert admin.get('/api/admin/audit?since=2024-01-01&until=2030-01-01').status_code == 200
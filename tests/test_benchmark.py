@@ -0,0 +1,78 @@
+import app as clinic
+
+
+def seed(**options):
+    defaults = dict(patients=20, doctors=4, appointments_per_patient=3, vitals_per_patient=3,
+                    records_per_patient=2, prescriptions_per_patient=2, batch_size=7)
+    return clinic.generate_synthetic_data(**{**defaults, **options})
+
+
+def test_synthetic_data_has_the_requested_volume(app):
+    counts = seed()
+    assert counts == {'doctors': 4, 'patients': 20, 'appointments': 60, 'vitals': 60,
+                      'medical_records': 40, 'prescriptions': 40}
+    assert clinic.Appointment.query.count() == 60
+    assert clinic.Vitals.query.count() == 60
+
+
+def test_synthetic_vitals_have_trend_statistics(app):
+    seed()
+    readings = clinic.db.session.query(clinic.Vitals.patient_id, clinic.db.func.count()).group_by(
+        clinic.Vitals.patient_id).all()
+    stats = dict(clinic.db.session.query(clinic.VitalsStats.patient_id, clinic.VitalsStats.count).filter(
+        clinic.VitalsStats.vital == 'heart_rate'))
+    assert stats == dict(readings)
+    assert clinic.VitalsDailyStats.query.count() > 0
+
+
+def test_bulk_insert_consumes_generators_in_batches(app):
+    rows = ({'name': f'Gen {n}', 'age': 30, 'gender': 'Male', 'cnic': f'gen-{n}', 'email': f'gen{n}@test.clinic',
+             'password': 'x', 'contact': '0300'} for n in range(25))
+    assert clinic.bulk_insert(clinic.Patient, rows, batch_size=10) == 25
+    assert clinic.Patient.query.count() == 25
+
+
+def test_synthetic_data_is_reproducible_for_a_seed(app):
+    seed(seed=7)
+    first = [(a.patient_id, a.doctor_id, a.date, a.time) for a in clinic.Appointment.query.order_by(clinic.Appointment.id)]
+    clinic.db.drop_all()
+    clinic.db.create_all()
+    seed(seed=7)
+    second = [(a.patient_id, a.doctor_id, a.date, a.time) for a in clinic.Appointment.query.order_by(clinic.Appointment.id)]
+    assert first == second
+
+
+def test_benchmark_reports_every_route(app):
+    seed()
+    results = clinic.run_benchmark(iterations=2, sample_patients=2)
+    assert {'patient_dashboard', 'vitals_api', 'download_medical_summary', 'book_appointment_post',
+            'cancel_appointment', 'export_patient_history', 'audit_log_api'} <= set(results)
+    assert results['patient_dashboard']['requests'] == 4  # iterations x sampled patients
+    for route in results.values():
+        assert route['p50_ms'] <= route['p95_ms'] <= route['p99_ms']
+
+
+def test_regressions_compare_p95_against_the_baseline():
+    baseline = {'fast': {'p95_ms': 10.0, 'sql_max': 3}, 'slow': {'p95_ms': 10.0, 'sql_max': 3}}
+    results = {'fast': {'p95_ms': 10.5, 'sql_max': 3}, 'slow': {'p95_ms': 20.0, 'sql_max': 5}}
+    regressions = clinic.find_regressions(results, baseline, tolerance=0.2)
+    assert regressions == ['slow: p95 10.0ms -> 20.0ms', 'slow: SQL statements 3 -> 5']
+
+
+def test_benchmark_measures_admin_routes_as_an_admin(app):
+    seed()
+    results = clinic.run_benchmark(iterations=1, sample_patients=2)
+    assert {name: r['unexpected_statuses'] for name, r in results.items() if r['unexpected_statuses']} == {}
+    assert results['audit_log_api']['requests'] == 2
+
+
+def test_login_redirects_and_errors_are_flagged():
+    class Response:
+        def __init__(self, status_code, location=None):
+            self.status_code = status_code
+            self.headers = {'Location': location} if location else {}
+
+    assert clinic.unexpected_response(Response(302, '/login/admin'))
+    assert clinic.unexpected_response(Response(404))
+    assert not clinic.unexpected_response(Response(302, '/patient/dashboard'))
+    assert not clinic.unexpected_response(Response(200))
@@ -0,0 +1,71 @@
+import gzip
+import os
+from datetime import date, datetime, time, timedelta
+
+import app as clinic
+
+
+def test_conditional_get_answers_304_until_the_patients_data_changes(login):
+    client = login()
+    first = client.get('/patient/dashboard')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    cached = client.get('/patient/dashboard', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    client.post('/patient/vitals', data={'heart_rate': '72'})
+    with client.session_transaction() as sess:
+        sess.pop('_flashes', None)
+    changed = client.get('/patient/dashboard', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_etag_is_per_patient(login):
+    first, second = login('first'), login('second')
+    etag = first.get('/patient/dashboard').headers['ETag']
+    assert second.get('/patient/dashboard', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_large_pages_are_gzipped_when_accepted(login):
+    client = login()
+    plain = client.get('/patient/dashboard')
+    compressed = client.get('/patient/dashboard', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_cached_views_do_not_depend_on_the_time_of_day(login):
+    client = login()
+    assert b'<span id="currentTime"></span>' in client.get('/patient/dashboard').data
+
+    # The vitals window starts at midnight, so the same request gives the same body all day
+    window_start = datetime.combine(date.today() - timedelta(days=30), time(0, 5))
+    clinic.db.session.add(clinic.Vitals(patient_id=client.patient_id, date=window_start, heart_rate=66))
+    clinic.db.session.commit()
+    assert client.get('/api/patient/vitals?days=30').json['heart_rate'] == [66]
+
+
+def test_template_or_static_deploys_change_the_etag_salt(tmp_path, app, login):
+    templates, uploads = tmp_path / 'templates', tmp_path / 'static' / 'uploads'
+    uploads.mkdir(parents=True)
+    templates.mkdir()
+    (templates / 'page.html').write_text('v1')
+    (uploads / 'photo.png').write_bytes(b'')
+    folders = [str(templates), str(tmp_path / 'static')]
+    before = clinic.deploy_version(folders)
+
+    future = datetime.now().timestamp() + 3600
+    os.utime(uploads / 'photo.png', (future, future))
+    assert clinic.deploy_version(folders) == before  # user uploads are not a deploy
+    os.utime(templates / 'page.html', (future, future))
+    assert clinic.deploy_version(folders) == str(int(future))
+
+    client = login()
+    etag = client.get('/patient/dashboard').headers['ETag']
+    app.config['ETAG_SALT'] = clinic.deploy_version(folders)
+    assert client.get('/patient/dashboard', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,66 @@
+import json
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+def add_history(patient_id, doctor_id):
+    clinic.db.session.add_all([
+        clinic.Appointment(patient_id=patient_id, doctor_id=doctor_id, date=date.today() + timedelta(days=1),
+                           time='10:00 AM', status='scheduled'),
+        clinic.MedicalRecord(patient_id=patient_id, doctor_id=doctor_id, diagnosis='Flu'),
+        clinic.Prescription(patient_id=patient_id, doctor_id=doctor_id, medication='Paracetamol',
+                            dosage='500mg', frequency='Twice daily', duration='5 days'),
+    ] + [clinic.Vitals(patient_id=patient_id, date=datetime.now() - timedelta(days=n), heart_rate=70 + n)
+         for n in range(5)])
+    clinic.db.session.commit()
+
+
+def test_ndjson_export_streams_every_table_without_passwords(app, make_doctor, login):
+    app.config['EXPORT_CHUNK_SIZE'] = 2
+    client = login()
+    add_history(client.patient_id, make_doctor())
+
+    response = client.get('/patient/export')
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'].endswith(f'medical_history_{client.patient_id}.ndjson')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['type'] for line in lines] == (
+        ['patient', 'appointment', 'medical_record'] + ['vitals'] * 5 + ['prescription'])
+    assert 'password' not in lines[0]
+    assert [line['heart_rate'] for line in lines if line['type'] == 'vitals'] == [74, 73, 72, 71, 70]
+    response.close()
+
+
+def test_fhir_export_is_one_valid_bundle(make_doctor, login):
+    client = login()
+    add_history(client.patient_id, make_doctor())
+
+    with client.get('/patient/export?format=fhir') as response:
+        bundle = json.loads(response.get_data(as_text=True))
+    assert bundle['resourceType'] == 'Bundle'
+    assert [entry['resource']['resourceType'] for entry in bundle['entry']] == (
+        ['Patient', 'Appointment', 'Encounter'] + ['Observation'] * 5 + ['MedicationRequest'])
+
+
+def test_unknown_export_format_is_rejected(login):
+    assert login().get('/patient/export?format=xml').status_code == 400
+
+
+def test_writes_are_not_blocked_while_an_export_is_being_downloaded(app, make_doctor, login):
+    app.config['EXPORT_CHUNK_SIZE'] = 2
+    client = login()
+    add_history(client.patient_id, make_doctor())
+
+    with client.get('/patient/export') as response:
+        chunks = response.iter_encoded()
+        for _ in range(4):  # patient, appointment, medical record and the first vitals row
+            next(chunks)
+        writer = sqlite3.connect(clinic.db.engine.url.database, timeout=0)
+        writer.execute("INSERT INTO vitals (patient_id, date, heart_rate) VALUES (?, ?, 90)",
+                       (client.patient_id, datetime.now().isoformat(sep=' ')))
+        writer.commit()
+        writer.close()
+        rest = b''.join(chunks).decode()
+    assert rest.count('"type": "vitals"') == 5  # the new row sorts last, so a later chunk picks it up
@@ -0,0 +1,74 @@
+import csv
+import json
+
+import app as clinic
+
+FIELDS = ['name', 'age', 'gender', 'cnic', 'email', 'password', 'contact']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def patient_row(n, **overrides):
+    return {'name': f'Imported {n}', 'age': 30, 'gender': 'Female', 'cnic': f'imp-{n}',
+            'email': f'imported{n}@test.clinic', 'password': f'secret{n}', 'contact': '0302-0000000', **overrides}
+
+
+def read_rejects(path):
+    with open(f'{path}.rejects.ndjson') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_import_inserts_valid_rows_and_records_rejects(app, login, tmp_path):
+    login('existing')
+    path = str(tmp_path / 'patients.csv')
+    write_csv(path, [
+        patient_row(1),
+        patient_row(2, cnic='imp-1'),  # duplicate within the file
+        patient_row(3, email='existing@test.clinic'),  # already registered
+        patient_row(4, age='old'),
+        patient_row(5, contact=''),
+    ])
+
+    result = clinic.import_accounts('patient', path, chunk_size=2, workers=1)
+    assert (result['imported'], result['rejected'], result['rows_done']) == (1, 4, 5)
+    reasons = {r['row']: r['reason'] for r in read_rejects(path)}
+    assert reasons == {2: 'duplicate cnic in file', 3: 'email already registered',
+                       4: "invalid number: invalid literal for int() with base 10: 'old'", 5: 'missing contact'}
+
+    imported = clinic.Patient.query.filter_by(email='imported1@test.clinic').one()
+    assert imported.password != 'secret1'
+    response = app.test_client().post('/login/patient', data={'email': 'imported1@test.clinic', 'password': 'secret1'})
+    assert response.status_code == 302 and '/login' not in response.headers['Location']
+
+
+def test_import_resumes_after_the_checkpoint(app, tmp_path):
+    path = str(tmp_path / 'patients.ndjson')
+    with open(path, 'w') as f:
+        for n in range(3):
+            f.write(json.dumps(patient_row(n)) + '\n')
+    assert clinic.import_accounts('patient', path, chunk_size=2, workers=1)['imported'] == 3
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(patient_row(3)) + '\n')
+        f.write('{broken\n')
+    result = clinic.import_accounts('patient', path, chunk_size=2, workers=1)
+    assert (result['imported'], result['rejected'], result['rows_done']) == (4, 1, 5)
+    assert clinic.Patient.query.count() == 4
+
+
+def test_rejects_file_never_contains_passwords(app, tmp_path):
+    path = str(tmp_path / 'patients.ndjson')
+    with open(path, 'w') as f:
+        f.write(json.dumps(patient_row(1, contact='')) + '\n')
+        f.write('{"name": "Broken", "password": "hunter2", \n')
+
+    clinic.import_accounts('patient', path, chunk_size=2, workers=1)
+    rejects = read_rejects(path)
+    assert rejects[0]['data']['password'] == '[redacted]'
+    assert 'hunter2' not in rejects[1]['data']['_invalid']
+    assert 'secret1' not in open(f'{path}.rejects.ndjson').read()
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+def prescribe(patient_id, doctor_id, duration, issued, refills=0):
+    prescription = clinic.Prescription(
+        patient_id=patient_id, doctor_id=doctor_id, date=issued, medication='Amoxicillin',
+        dosage='500mg', frequency='Twice daily', duration=duration, refills=refills
+    )
+    clinic.db.session.add(prescription)
+    clinic.db.session.commit()
+    return prescription.id
+
+
+def test_parse_duration_days():
+    assert clinic.parse_duration_days('2 weeks') == 14
+    assert clinic.parse_duration_days('10 Days') == 10
+    assert clinic.parse_duration_days('1 month') == 30
+    assert clinic.parse_duration_days('Ongoing') is None
+    assert clinic.parse_duration_days(None) is None
+
+
+def test_expire_prescriptions_renews_refills_then_deactivates(make_doctor, login):
+    doctor_id = make_doctor()
+    patient_id = login().patient_id
+    issued = datetime.now() - timedelta(days=20)
+    ended = prescribe(patient_id, doctor_id, '7 days', issued)
+    refilled = prescribe(patient_id, doctor_id, '7 days', issued, refills=1)
+    ongoing = prescribe(patient_id, doctor_id, 'Ongoing', issued)
+    current = prescribe(patient_id, doctor_id, '1 month', issued)
+
+    result = clinic.expire_prescriptions(today=date.today(), batch_size=1)
+    assert result['renewed'] == 1
+
+    def row(prescription_id):
+        clinic.db.session.expire_all()
+        return clinic.db.session.get(clinic.Prescription, prescription_id)
+
+    assert row(ended).active is False
+    assert row(ongoing).active is True and row(ongoing).end_date is None
+    assert row(current).active is True
+    # One refill only covers days 7-14, so the refilled course has ended too
+    assert row(refilled).refills_used == 1 and row(refilled).active is False
+
+
+def test_run_jobs_once_runs_every_job_and_exits(app, make_doctor, login, monkeypatch):
+    monkeypatch.setattr(clinic, 'appointment_scheduler', clinic.AppointmentScheduler(clinic.LogReminderSink()))
+    ended = prescribe(login().patient_id, make_doctor(), '3 days', datetime.now() - timedelta(days=10))
+
+    result = app.test_cli_runner().invoke(args=['run-jobs', '--once'])
+    assert result.exit_code == 0, result.output
+    assert [line.split()[1] for line in result.output.splitlines()] == [
+        'prescription-expiry', 'appointment-scheduler', 'waitlist-offers']
+    clinic.db.session.expire_all()
+    assert clinic.db.session.get(clinic.Prescription, ended).active is False
+    assert clinic.background_jobs == []
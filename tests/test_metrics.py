@@ -0,0 +1,33 @@
+import app as clinic
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = clinic.Histogram('demo_seconds', 'Demo', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, endpoint='x')
+    assert histogram.render()[2:] == [
+        'demo_seconds_bucket{endpoint="x",le="0.1"} 1',
+        'demo_seconds_bucket{endpoint="x",le="1"} 2',
+        'demo_seconds_bucket{endpoint="x",le="+Inf"} 3',
+        'demo_seconds_sum{endpoint="x"} 5.55',
+        'demo_seconds_count{endpoint="x"} 3',
+    ]
+
+
+def test_metrics_endpoint_counts_requests_and_sql(login):
+    client = login()
+    client.get('/patient/dashboard')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'clinic_requests_total{endpoint="patient_dashboard",method="GET",status="200"}' in body
+    assert 'clinic_request_sql_statements_count{endpoint="patient_dashboard"}' in body
+    assert 'clinic_request_duration_seconds_bucket{endpoint="patient_dashboard",le="+Inf"}' in body
+
+
+def test_profiling_is_opt_in(app, login, tmp_path, monkeypatch):
+    monkeypatch.setattr(clinic, 'PROFILE_FOLDER', str(tmp_path))
+    client = login()
+    assert 'X-Profile-File' not in client.get('/patient/dashboard', headers={'X-Profile': '1'}).headers
+
+    app.config['PROFILING_ENABLED'] = True
+    response = client.get('/patient/dashboard', headers={'X-Profile': '1'})
+    assert (tmp_path / response.headers['X-Profile-File']).exists()
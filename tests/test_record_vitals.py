@@ -0,0 +1,48 @@
+import json
+
+import app as clinic
+
+
+def test_blood_pressure_and_aliases_are_parsed_into_typed_columns():
+    parsed = clinic.parse_record_vitals(json.dumps({
+        'Blood_Pressure': '128/84', 'pulse': '72', 'Temp': 98.6, 'SpO2': 97, 'weight': '70.5'
+    }))
+    assert parsed == {'vital_heart_rate': 72, 'vital_bp_systolic': 128, 'vital_bp_diastolic': 84,
+                      'vital_temperature': 98.6, 'vital_oxygen_saturation': 97, 'vital_weight': 70.5}
+
+
+def test_unparseable_vitals_leave_the_columns_empty():
+    empty = dict.fromkeys(clinic.RECORD_VITAL_COLUMNS)
+    assert clinic.parse_record_vitals('not json') == empty
+    assert clinic.parse_record_vitals('[1, 2]') == empty
+    assert clinic.parse_record_vitals(json.dumps({'heart_rate': 'fast'}))['vital_heart_rate'] is None
+
+
+def test_non_finite_vitals_are_treated_as_missing():
+    parsed = clinic.parse_record_vitals('{"heart_rate": 1e999, "temperature": NaN, "weight": "inf"}')
+    assert (parsed['vital_heart_rate'], parsed['vital_temperature'], parsed['vital_weight']) == (None, None, None)
+
+
+def test_setting_vitals_keeps_the_typed_columns_in_sync(app, make_doctor, login):
+    record = clinic.MedicalRecord(patient_id=login().patient_id, doctor_id=make_doctor(), diagnosis='Checkup',
+                                  vitals=json.dumps({'heart_rate': 110}))
+    clinic.db.session.add(record)
+    clinic.db.session.commit()
+    assert clinic.MedicalRecord.query.filter(clinic.MedicalRecord.vital_heart_rate > 100).count() == 1
+
+    record.vitals = json.dumps({'heart_rate': 80})
+    clinic.db.session.commit()
+    assert clinic.MedicalRecord.query.filter(clinic.MedicalRecord.vital_heart_rate > 100).count() == 0
+
+
+def test_backfill_fills_rows_written_without_the_typed_columns(app, make_doctor, login):
+    table = clinic.MedicalRecord.__table__
+    clinic.db.session.execute(table.insert().values(
+        patient_id=login().patient_id, doctor_id=make_doctor(), visit_date=clinic.datetime.utcnow(),
+        diagnosis='Legacy', vitals=json.dumps({'blood_pressure': '150/95'})
+    ))
+    clinic.db.session.commit()
+
+    assert clinic.backfill_record_vitals(batch_size=1) == 1
+    record = clinic.MedicalRecord.query.one()
+    assert (record.vital_bp_systolic, record.vital_bp_diastolic) == (150, 95)
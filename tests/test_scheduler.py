@@ -0,0 +1,99 @@
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+class ListSink:
+    def __init__(self):
+        self.delivered = []
+
+    def deliver(self, reminder):
+        self.delivered.append(reminder)
+
+
+def add_appointment(patient_id, doctor_id, day, time='10:00 AM'):
+    appointment = clinic.Appointment(patient_id=patient_id, doctor_id=doctor_id, date=day, time=time,
+                                     status='scheduled')
+    clinic.db.session.add(appointment)
+    clinic.db.session.commit()
+    return appointment.id
+
+
+def status_of(appointment_id):
+    clinic.db.session.expire_all()
+    return clinic.db.session.get(clinic.Appointment, appointment_id).status
+
+
+def test_reminder_is_delivered_once_when_due(make_doctor, login):
+    doctor_id = make_doctor()
+    patient_id = login().patient_id
+    tomorrow = date.today() + timedelta(days=1)
+    appointment_id = add_appointment(patient_id, doctor_id, tomorrow)
+    sink = ListSink()
+    scheduler = clinic.AppointmentScheduler(sink)
+
+    early = datetime.combine(date.today(), datetime.min.time())
+    assert scheduler.tick(now=early)['reminded'] == 0
+    due = clinic.appointment_start(tomorrow, '10:00 AM') - timedelta(minutes=clinic.app.config['REMINDER_LEAD_MINUTES'])
+    assert scheduler.tick(now=due)['reminded'] == 1
+    assert scheduler.tick(now=due + timedelta(minutes=1))['reminded'] == 0
+
+    assert [r['appointment_id'] for r in sink.delivered] == [appointment_id]
+    assert sink.delivered[0]['doctor'] == 'Dr. Test'
+
+
+def test_sweep_marks_visits_completed_and_the_rest_no_show(make_doctor, login):
+    doctor_id = make_doctor()
+    patient_id = login().patient_id
+    yesterday = date.today() - timedelta(days=1)
+    visited = add_appointment(patient_id, doctor_id, yesterday, '09:00 AM')
+    missed = add_appointment(patient_id, doctor_id, yesterday - timedelta(days=1))
+    clinic.db.session.add(clinic.MedicalRecord(
+        patient_id=patient_id, doctor_id=doctor_id, diagnosis='Flu',
+        visit_date=datetime.combine(yesterday, datetime.min.time()) + timedelta(hours=9)
+    ))
+    clinic.db.session.commit()
+
+    result = clinic.AppointmentScheduler(ListSink()).tick(now=datetime.now())
+    assert result == {'reminded': 0, 'swept': 2}
+    assert status_of(visited) == 'completed'
+    assert status_of(missed) == 'no-show'
+
+
+def test_window_is_reloaded_to_pick_up_bookings_from_other_processes(app, make_doctor, login):
+    doctor_id, patient_id = make_doctor(), login().patient_id
+    sink = ListSink()
+    scheduler = clinic.AppointmentScheduler(sink)
+    midnight = datetime.combine(date.today(), datetime.min.time())
+    scheduler.tick(now=midnight)
+
+    # Inserted behind the scheduler's back, as a web worker in another process would
+    tomorrow = date.today() + timedelta(days=1)
+    add_appointment(patient_id, doctor_id, tomorrow)
+    due = clinic.appointment_start(tomorrow, '10:00 AM') - timedelta(minutes=clinic.app.config['REMINDER_LEAD_MINUTES'])
+
+    app.config['SCHEDULER_RELOAD_SECONDS'] = 24 * 3600
+    assert scheduler.tick(now=due)['reminded'] == 0
+    app.config['SCHEDULER_RELOAD_SECONDS'] = 300
+    assert scheduler.tick(now=due + timedelta(minutes=1))['reminded'] == 1
+
+
+def test_window_query_only_walks_scheduled_rows(app):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith('SELECT') and 'FROM appointment' in statement:
+            statements.append((statement, parameters))
+
+    engine = clinic.db.engine
+    clinic.event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        clinic.AppointmentScheduler(ListSink()).extend_window(datetime.now())
+    finally:
+        clinic.event.remove(engine, 'before_cursor_execute', capture)
+
+    statement, parameters = statements[0]
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    # Finished appointments make up most of the history; the (date, status) index would walk all of them
+    assert 'ix_appointment_status_date (status=? AND date<?)' in ' '.join(row[-1] for row in plan)
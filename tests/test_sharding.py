@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+def book(client, doctor_id, day, time='10:00 AM', follow_redirects=False, **extra):
+    return client.post('/patient/book-appointment', data={
+        'doctor_id': doctor_id, 'date': day.isoformat(), 'time': time, 'symptoms': 'Checkup', **extra
+    }, follow_redirects=follow_redirects)
+
+
+def upcoming_times(client):
+    return [a['time'] for a in client.get('/api/patient/appointments').json]
+
+
+def test_bookings_go_to_the_doctors_hospital_shard(app, make_doctor, login):
+    app.config['SHARDING_ENABLED'] = True
+    north = make_doctor('Dr. North', 'North Hospital')
+    south = make_doctor('Dr. South', 'South Hospital')
+    client = login()
+    day = date.today() + timedelta(days=2)
+
+    book(client, north, day, time='09:00 AM')
+    book(client, south, day, time='10:00 AM')
+
+    appointments = client.get('/api/patient/appointments').json
+    assert [a['time'] for a in appointments] == ['09:00 AM', '10:00 AM']
+    shards = {clinic.shard_router.shard_for_id(a['id']) for a in appointments}
+    assert len(shards) == 2 and 0 not in shards
+    with clinic.shard_router.use(0):
+        assert clinic.Appointment.query.count() == 0
+
+    client.post(f"/patient/appointment/{appointments[0]['id']}/cancel")
+    assert upcoming_times(client) == ['10:00 AM']
+
+
+def test_split_shards_moves_legacy_bookings(app, make_doctor, login):
+    doctor_id = make_doctor('Dr. Legacy', 'North Hospital')
+    client = login()
+    book(client, doctor_id, date.today() + timedelta(days=2))
+
+    app.config['SHARDING_ENABLED'] = True
+    assert clinic.split_shards() == 1
+    appointment = client.get('/api/patient/appointments').json[0]
+    assert clinic.shard_router.shard_for_id(appointment['id']) != 0
+    with clinic.shard_router.use(0):
+        assert clinic.Appointment.query.count() == 0
+
+
+def test_booking_bumps_the_data_version_inside_its_shard(app, make_doctor, login):
+    app.config['SHARDING_ENABLED'] = True
+    doctor_id = make_doctor('Dr. North', 'North Hospital')
+    client = login()
+    etag = client.get('/api/patient/appointments').headers['ETag']
+
+    def clinic_db_version():
+        return clinic.db.session.execute(
+            clinic.db.select(clinic.DataVersion.version).where(clinic.DataVersion.patient_id == client.patient_id),
+            bind_arguments={'bind': clinic.db.engine}
+        ).scalar()
+
+    before = clinic_db_version()
+    book(client, doctor_id, date.today() + timedelta(days=2), follow_redirects=True)
+    assert clinic_db_version() == before
+    response = client.get('/api/patient/appointments', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_doctor_keeps_their_shard_after_changing_hospital(app, make_doctor, login):
+    app.config['SHARDING_ENABLED'] = True
+    doctor_id = make_doctor('Dr. Mover', 'North Hospital')
+    first, second = login('first'), login('second')
+    day = date.today() + timedelta(days=2)
+
+    book(first, doctor_id, day)
+    clinic.db.session.get(clinic.Doctor, doctor_id).current_hospital = 'South Hospital'
+    clinic.db.session.commit()
+
+    response = book(second, doctor_id, day, follow_redirects=True)
+    assert b'already booked' in response.data
+    assert upcoming_times(second) == []
+
+
+def test_pinning_a_doctor_inside_a_write_transaction_does_not_deadlock(app, make_doctor, login):
+    doctor_id = make_doctor('Dr. Legacy', 'North Hospital')
+    first, waiting = login('first'), login('waiting')
+    day = date.today() + timedelta(days=3)
+    book(first, doctor_id, day)
+    book(waiting, doctor_id, day, join_waitlist='1')
+    first.post(f"/patient/appointment/{first.get('/api/patient/appointments').json[0]['id']}/cancel")
+
+    # The doctor has no shard yet; resolving it happens after the sweep has already written to clinic.db
+    app.config['SHARDING_ENABLED'] = True
+    later = datetime.now() + timedelta(minutes=app.config['WAITLIST_HOLD_MINUTES'] + 1)
+    assert clinic.expire_waitlist_offers(now=later) == 1
+    number = clinic.shard_router.hospitals['North Hospital']  # cached once the sweep committed
+    assert clinic.db.session.get(clinic.Doctor, doctor_id).shard_id == number != 0
+
+
+def test_patient_views_only_read_the_shards_the_patient_booked_in(app, make_doctor, login):
+    app.config['SHARDING_ENABLED'] = True
+    north = make_doctor('Dr. North', 'North Hospital')
+    south = make_doctor('Dr. South', 'South Hospital')
+    client, other = login('client'), login('other')
+    day = date.today() + timedelta(days=2)
+    book(client, north, day, follow_redirects=True)
+    book(other, south, day, follow_redirects=True)
+
+    north_shard = clinic.shard_router.hospitals['North Hospital']
+    south_engine = clinic.shard_router.engine(clinic.shard_router.hospitals['South Hospital'])
+    assert clinic.shard_router.patient_shards(client.patient_id) == [0, north_shard]
+
+    statements = []
+    clinic.event.listen(south_engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert upcoming_times(client) == ['10:00 AM']
+    assert client.get('/patient/appointments').status_code == 200
+    with client.get('/patient/export') as response:
+        assert b'"type": "appointment"' in response.data
+    assert statements == []
+
+
+def test_patient_shards_are_backfilled_from_existing_shards(app, make_doctor, login):
+    app.config['SHARDING_ENABLED'] = True
+    doctor_id = make_doctor('Dr. North', 'North Hospital')
+    client = login()
+    book(client, doctor_id, date.today() + timedelta(days=2))
+    clinic.PatientShard.query.delete()
+    clinic.db.session.commit()
+    assert upcoming_times(client) == []
+
+    assert clinic.backfill_patient_shards() == 1
+    assert upcoming_times(client) == ['10:00 AM']
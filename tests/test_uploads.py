@@ -0,0 +1,88 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import app as clinic
+
+
+@pytest.fixture
+def upload_dirs(tmp_path, monkeypatch):
+    uploads = tmp_path / 'patients'
+    thumbs = uploads / 'thumbs'
+    thumbs.mkdir(parents=True)
+    monkeypatch.setattr(clinic, 'PATIENT_UPLOAD_FOLDER', str(uploads))
+    monkeypatch.setattr(clinic, 'PATIENT_THUMB_FOLDER', str(thumbs))
+    return uploads, thumbs
+
+
+def png_bytes(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 200), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload_picture(client, data, filename='me.png'):
+    return client.post('/patient/profile', data={
+        'name': 'Patient', 'age': '30', 'gender': 'Male', 'contact': '0301-0000000',
+        'profile_picture': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+
+
+def wait_for(path, timeout=5):
+    deadline = time.time() + timeout
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.05)
+    return os.path.exists(path)
+
+
+def test_identical_uploads_share_one_file_and_get_thumbnails(login, upload_dirs):
+    uploads, thumbs = upload_dirs
+    first, second = login('first'), login('second')
+    upload_picture(first, png_bytes())
+    upload_picture(second, png_bytes())
+
+    names = {clinic.db.session.get(clinic.Patient, c.patient_id).profile_picture for c in (first, second)}
+    assert len(names) == 1
+    name = names.pop()
+    assert sorted(os.listdir(uploads)) == sorted([name, 'thumbs'])
+    for size in clinic.app.config['THUMBNAIL_SIZES']:
+        assert wait_for(thumbs / clinic.thumbnail_name(name, size))
+
+    response = first.get(f'/media/patients/{name}')
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_unsupported_upload_type_is_rejected(login, upload_dirs):
+    client = login()
+    response = upload_picture(client, b'#!/bin/sh', filename='run.sh')
+    assert response.status_code == 200  # form re-rendered with the error
+    assert clinic.db.session.get(clinic.Patient, client.patient_id).profile_picture is None
+    assert os.listdir(upload_dirs[0]) == ['thumbs']
+
+
+def test_gc_removes_only_unreferenced_uploads(login, upload_dirs):
+    uploads, _ = upload_dirs
+    client = login()
+    upload_picture(client, png_bytes('blue'))
+    (uploads / 'orphan.png').write_bytes(b'old')
+
+    assert clinic.collect_orphaned_uploads(grace_seconds=-1) >= 1
+    kept = clinic.db.session.get(clinic.Patient, client.patient_id).profile_picture
+    assert os.path.exists(uploads / kept)
+    assert not os.path.exists(uploads / 'orphan.png')
+
+
+def test_reusing_a_duplicate_refreshes_its_mtime(login, upload_dirs):
+    uploads, _ = upload_dirs
+    first, second = login('first'), login('second')
+    upload_picture(first, png_bytes('green'))
+    name = clinic.db.session.get(clinic.Patient, first.patient_id).profile_picture
+    stale = time.time() - 7 * 24 * 3600
+    os.utime(uploads / name, (stale, stale))
+
+    upload_picture(second, png_bytes('green'))
+    assert os.path.getmtime(uploads / name) > stale + 3600
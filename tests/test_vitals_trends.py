@@ -0,0 +1,32 @@
+import app as clinic
+
+
+def test_trends_match_the_recorded_readings_and_a_full_rebuild(app, login):
+    client = login()
+    for heart_rate in (70, 80, 120):
+        client.post('/patient/vitals', data={'heart_rate': heart_rate, 'bp_systolic': 120, 'bp_diastolic': 80})
+
+    trends = client.get('/api/patient/vitals/trends').json
+    heart = trends['vitals']['heart_rate']
+    assert (heart['count'], heart['mean'], heart['min'], heart['max'], heart['latest']) == (3, 90.0, 70, 120, 120)
+    assert heart['out_of_range'] is True
+    assert heart['windows']['7']['count'] == 3
+    assert trends['risk'] == 'Medium'
+
+    assert clinic.rebuild_vitals_stats() == 3
+    assert client.get('/api/patient/vitals/trends').json == trends
+
+
+def test_health_risk_levels():
+    assert clinic.health_risk({'heart_rate': 72, 'bmi': 22}) == 'Low'
+    assert clinic.health_risk({'heart_rate': 130, 'bmi': 32}) == 'High'
+
+
+def test_very_low_heart_rate_scores_like_the_js_analyzer():
+    # predictHealthRisk adds 2 for any heart rate outside 60-100, however far outside
+    assert clinic.health_risk({'heart_rate': 45, 'bmi': 17}) == 'Medium'
+
+
+def test_vitals_page_shows_the_server_trends(login):
+    page = login().get('/patient/vitals').data
+    assert b'id="healthRisk"' in page and b'dsa-implementations.js' in page
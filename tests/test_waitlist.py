@@ -0,0 +1,121 @@
+from datetime import date, datetime, timedelta
+
+import app as clinic
+
+
+def book(client, doctor_id, day, time='10:00 AM', follow_redirects=False, **extra):
+    return client.post('/patient/book-appointment', data={
+        'doctor_id': doctor_id, 'date': day.isoformat(), 'time': time, 'symptoms': 'Checkup', **extra
+    }, follow_redirects=follow_redirects)
+
+
+def upcoming_times(client):
+    return [a['time'] for a in client.get('/api/patient/appointments').json]
+
+
+def test_cancelled_slot_is_offered_to_the_waitlist(make_doctor, login):
+    doctor_id = make_doctor()
+    first, normal, urgent = login('first'), login('normal'), login('urgent')
+    day = date.today() + timedelta(days=3)
+
+    book(first, doctor_id, day)
+    book(normal, doctor_id, day, join_waitlist='1')
+    book(urgent, doctor_id, day, join_waitlist='1', priority='urgent')
+    assert [e['status'] for e in normal.get('/api/patient/waitlist').json] == ['waiting']
+
+    first.post(f"/patient/appointment/{first.get('/api/patient/appointments').json[0]['id']}/cancel")
+
+    # Urgent entries are served before earlier normal ones
+    assert normal.get('/api/patient/waitlist').json[0]['status'] == 'waiting'
+    offer = urgent.get('/api/patient/waitlist').json[0]
+    assert offer['status'] == 'offered'
+
+    urgent.post(f"/patient/waitlist/{offer['id']}/accept")
+    assert upcoming_times(urgent) == ['10:00 AM']
+    assert urgent.get('/api/patient/waitlist').json == []
+
+
+def test_cancelled_slot_is_held_for_the_waitlist_head(make_doctor, login):
+    doctor_id = make_doctor()
+    first, waiting, other = login('first'), login('waiting'), login('other')
+    day = date.today() + timedelta(days=3)
+
+    book(first, doctor_id, day)
+    book(waiting, doctor_id, day, join_waitlist='1')
+    appointment_id = first.get('/api/patient/appointments').json[0]['id']
+    first.post(f'/patient/appointment/{appointment_id}/cancel')
+
+    offer = waiting.get('/api/patient/waitlist').json[0]
+    assert offer['status'] == 'offered'
+
+    # The held slot is neither bookable nor listed as free while the offer is live
+    response = book(other, doctor_id, day, follow_redirects=True)
+    assert b'already booked' in response.data
+    assert upcoming_times(other) == []
+    available = other.get(f'/api/doctors/available?date={day.isoformat()}').json
+    assert '10:00 AM' in available[0]['booked_slots']
+
+    waiting.post(f"/patient/waitlist/{offer['id']}/accept")
+    assert upcoming_times(waiting) == ['10:00 AM']
+
+
+def test_expired_offer_releases_the_slot(make_doctor, login):
+    doctor_id = make_doctor()
+    first, waiting, other = login('first'), login('waiting'), login('other')
+    day = date.today() + timedelta(days=3)
+
+    book(first, doctor_id, day)
+    book(waiting, doctor_id, day, join_waitlist='1')
+    first.post(f"/patient/appointment/{first.get('/api/patient/appointments').json[0]['id']}/cancel")
+
+    clinic.expire_waitlist_offers(now=datetime.now() + timedelta(minutes=clinic.app.config['WAITLIST_HOLD_MINUTES'] + 1))
+    assert waiting.get('/api/patient/waitlist').json == []
+
+    book(other, doctor_id, day)
+    assert upcoming_times(other) == ['10:00 AM']
+
+
+def test_waitlist_join_rejects_unknown_doctor_and_past_day(make_doctor, login):
+    doctor_id = make_doctor()
+    client = login()
+
+    response = client.post('/patient/waitlist/join', data={
+        'doctor_id': doctor_id + 100, 'date': (date.today() + timedelta(days=1)).isoformat()
+    }, follow_redirects=True)
+    assert b'Unknown doctor' in response.data
+
+    response = client.post('/patient/waitlist/join', data={
+        'doctor_id': doctor_id, 'date': (date.today() - timedelta(days=1)).isoformat()
+    }, follow_redirects=True)
+    assert b'past day' in response.data
+    assert client.get('/api/patient/waitlist').json == []
+
+
+def test_offers_are_delivered_through_the_reminder_sink(make_doctor, login, monkeypatch):
+    delivered = []
+    monkeypatch.setattr(clinic.appointment_scheduler.sink, 'deliver', delivered.append)
+    doctor_id = make_doctor()
+    first, waiting = login('first'), login('waiting')
+    day = date.today() + timedelta(days=3)
+
+    book(first, doctor_id, day)
+    book(waiting, doctor_id, day, join_waitlist='1')
+    assert delivered == []
+    first.post(f"/patient/appointment/{first.get('/api/patient/appointments').json[0]['id']}/cancel")
+
+    offer = waiting.get('/api/patient/waitlist').json[0]
+    assert [(d['type'], d['waitlist_entry_id'], d['patient'], d['start']) for d in delivered] == [
+        ('waitlist_offer', offer['id'], 'waiting', f'{day.isoformat()} 10:00 AM')]
+
+
+def test_rolled_back_offers_are_not_delivered(make_doctor, login, monkeypatch):
+    delivered = []
+    monkeypatch.setattr(clinic.appointment_scheduler.sink, 'deliver', delivered.append)
+    doctor_id = make_doctor()
+    day = date.today() + timedelta(days=3)
+    clinic.join_waitlist(login().patient_id, doctor_id, day)
+
+    assert clinic.offer_slot(doctor_id, day, '10:00 AM') is not None
+    clinic.db.session.rollback()
+    clinic.db.session.commit()
+    assert delivered == []